@@ -1,31 +1,86 @@
 from flask import Flask, request, jsonify, render_template, Response
 import os
 from werkzeug.utils import secure_filename
-import create_predict_data
 import predict
-import json
+import warmup
+import profiling
 import time
-import tempfile
+import uuid
+import threading
+from coalesce import Job, SingleFlight, save_and_hash
+from estimator import ProcessingTimeEstimator, describe_file
+from governor import Overloaded, ResourceGovernor
+from serving import (UPLOAD_FOLDER, MAX_CONTENT_LENGTH, MAX_CONTENT_PATH, allowed_file,
+                     send_estimate_time, send_result)
 
 app = Flask(__name__)
 
-# Use system temp directory for uploads in production
-if os.environ.get('RAILWAY_ENVIRONMENT'):
-    app.config['UPLOAD_FOLDER'] = tempfile.gettempdir()
-else:
-    app.config['UPLOAD_FOLDER'] = 'uploads'
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-app.config['MAX_CONTENT_LENGTH'] = 1000 * 1024 * 1024  # 100MB max file size
-app.config['MAX_CONTENT_PATH'] = 255  # Maximum length of file path
+app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+app.config['MAX_CONTENT_PATH'] = MAX_CONTENT_PATH
 
 
-def send_estimate_time(estimate_time):
-    return f"data: {json.dumps({'type': 'estimate', 'estimate_time': estimate_time})}\n\n"
+# Jobs currently being processed, keyed by the upload's content hash
+inflight = SingleFlight()
 
+# Memory/CPU budgets of this worker; admits, queues, degrades or rejects jobs
+governor = ResourceGovernor()
 
-def send_result(result, success):
-    return f"data: {json.dumps({'type': 'result','success':success, 'result': result})}\n\n"
+# Learns processing time per stage from the jobs this worker finishes; the
+# governor runs up to max_jobs of them at once, so queued jobs wait on that many
+estimator = ProcessingTimeEstimator(workers=governor.max_jobs)
+
+
+def run_job(job, filepath, profile_id=None):
+    """
+    Run the pipeline for a coalesced job and publish its events
+
+    Runs in its own thread so the job finishes even if the client that
+    started it disconnects; every attached request replays the events.
+    A profiled job (profile_id set) is private to its request and is not
+    registered in inflight.
+    """
+    plan = None
+    try:
+        start = time.perf_counter()
+        description = describe_file(filepath)
+        estimate_time = estimator.estimate(description, queue_depth=len(inflight) - 1)
+        job.publish(send_estimate_time(max(1, round(estimate_time))))
+        # Waits for memory/CPU budget; the plan may shorten or thin out the analysis
+        plan = governor.admit(description)
+        # Process audio file
+        if profile_id:
+            # Profiler overhead would skew the estimator, so it does not learn from this run
+            result = profiling.analyse_file_profiled(filepath, job.key, profile_id, plan)
+        else:
+            result = predict.analyse_file(filepath, route_key=job.key, plan=plan)
+            # Degraded runs analyse less audio than the file describes
+            if not result.get('degraded'):
+                estimator.observe(description, result.get('timings', {}), estimate_time,
+                                  time.perf_counter() - start)
+        # Already aggregated by the registry; candidate outputs are not for users
+        result.pop('shadow', None)
+        print(result)
+
+        job.publish(send_result(result, True), final=True)
+
+    except Overloaded as e:
+        job.publish(send_result({'success': False, 'message': str(e)}), final=True)
+    except Exception as e:
+        job.publish(send_result({
+            'success': False,
+            'message': f'Error processing file: {str(e)}'
+        }), final=True)
+    finally:
+        if plan is not None:
+            governor.release(plan)
+        if not profile_id:
+            inflight.release(job.key)
+        # Clean up
+        if os.path.exists(filepath):
+            os.remove(filepath)
 
 
 @app.route('/')
@@ -33,6 +88,34 @@ def index():
     return render_template('index.html')
 
 
+@app.route('/healthz')
+def healthz():
+    # Liveness: the process is up and serving requests
+    return jsonify({'status': 'ok'})
+
+
+@app.route('/readyz')
+def readyz():
+    # Readiness: only route uploads here once the pipeline has been warmed up
+    return jsonify(warmup.readiness.status()), 200 if warmup.readiness.ready else 503
+
+
+@app.route('/estimator')
+def estimator_stats():
+    return jsonify(estimator.stats())
+
+
+@app.route('/models')
+def model_stats():
+    registry = predict.get_registry()
+    return jsonify(dict(registry.describe(), shadow_stats=registry.shadow_stats()))
+
+
+@app.route('/governor')
+def governor_stats():
+    return jsonify(governor.stats())
+
+
 @app.route('/upload_file', methods=['POST'])
 def upload_file():
     try:
@@ -52,9 +135,7 @@ def upload_file():
                             mimetype='text/event-stream')
 
         # Check file extension
-        allowed_extensions = {'mp3', 'wav'}
-        if not '.' in file.filename or file.filename.rsplit(
-                '.', 1)[1].lower() not in allowed_extensions:
+        if not allowed_file(file.filename):
             return Response(send_result({
                 'success':
                 False,
@@ -63,19 +144,8 @@ def upload_file():
             }),
                             mimetype='text/event-stream')
 
-        # Check file size
-        file_size = len(file.read())
-        file.seek(0)  # Reset file pointer
-        if file_size > app.config['MAX_CONTENT_LENGTH']:
-            return Response(send_result({
-                'success':
-                False,
-                'message':
-                f'File too large. Maximum size is {app.config["MAX_CONTENT_LENGTH"] // (1024*1024)}MB'
-            }),
-                            mimetype='text/event-stream')
-
-        filename = secure_filename(file.filename)
+        # Unique name so concurrent uploads of the same file name never collide
+        filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
 
         # Check if file path is too long
@@ -86,33 +156,36 @@ def upload_file():
             }),
                             mimetype='text/event-stream')
 
-        file.save(filepath)
-
-        def generate():
-            try:
-                estimate_time = 2 * (
-                    create_predict_data.split_number(filepath) - 1
-                ) if create_predict_data.split_number(filepath) >= 2 else 3
-                yield send_estimate_time(estimate_time)
-                # Process audio file
-                features_df = create_predict_data.process_audio_files(filepath)
-
-                result = predict.predict_adhd(features_df)
-                print(result)
-
-                yield send_result(result, True)
-
-            except Exception as e:
-                yield send_result({
-                    'success': False,
-                    'message': f'Error processing file: {str(e)}'
-                })
-            finally:
-                # Clean up
-                if os.path.exists(filepath):
-                    os.remove(filepath)
+        # Save in chunks and hash the content; also enforces the size limit
+        content_hash, file_size = save_and_hash(file.stream, filepath,
+                                                app.config['MAX_CONTENT_LENGTH'])
+        if content_hash is None:
+            return Response(send_result({
+                'success':
+                False,
+                'message':
+                f'File too large. Maximum size is {app.config["MAX_CONTENT_LENGTH"] // (1024*1024)}MB'
+            }),
+                            mimetype='text/event-stream')
 
-        return Response(generate(), mimetype='text/event-stream')
+        # Profiled uploads always run on their own so the profile covers the whole pipeline
+        if profiling.requested(request.headers, request.args):
+            job = Job(content_hash)
+            profile_id = profiling.new_request_id()
+            print(f"Profiling upload as request {profile_id}")
+            threading.Thread(target=run_job, args=(job, filepath, profile_id), daemon=True).start()
+            return Response(job.subscribe(), mimetype='text/event-stream',
+                            headers={'X-Request-Id': profile_id})
+
+        # Identical audio already in progress: follow that job instead
+        job, is_leader = inflight.acquire(content_hash)
+        if is_leader:
+            threading.Thread(target=run_job, args=(job, filepath), daemon=True).start()
+        else:
+            print(f"Coalescing upload with in-flight job {content_hash[:12]}")
+            os.remove(filepath)
+
+        return Response(job.subscribe(), mimetype='text/event-stream')
 
     except Exception as e:
         return Response(send_result({
@@ -124,4 +197,6 @@ def upload_file():
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
+    warmup.run()
+    profiling.start_continuous()
     app.run(host='0.0.0.0', port=port)
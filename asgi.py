@@ -0,0 +1,300 @@
+"""
+Async serving entry point with the same contract as app.py
+
+Uploads and server-sent event streams are handled on an event loop, and
+only decoding, feature extraction and scoring run in a process pool, so a
+slow or idle client costs a coroutine instead of a whole worker. Run with:
+
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT
+
+PROCESS_WORKERS sets the size of the CPU pool (defaults to the CPU count).
+Every pool worker is warmed up at startup; /readyz answers 503 until then.
+If a pool worker dies (e.g. killed for running out of memory) the pool is
+replaced and warmed again, and /readyz answers 503 meanwhile.
+"""
+import os
+import time
+import uuid
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+
+from jinja2 import pass_context
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+from starlette.templating import Jinja2Templates
+from werkzeug.utils import secure_filename
+
+import predict
+import warmup
+import profiling
+from coalesce import AsyncJob, SingleFlight, save_and_hash
+from estimator import ProcessingTimeEstimator, describe_file
+from governor import Overloaded, ResourceGovernor
+from model_registry import ShadowStats, read_config
+from serving import (UPLOAD_FOLDER, MAX_CONTENT_LENGTH, MAX_CONTENT_PATH, allowed_file,
+                     send_estimate_time, send_result)
+
+pool = None
+# Background task warming the current pool
+warming = None
+# Jobs currently being processed, keyed by the upload's content hash
+inflight = SingleFlight(AsyncJob)
+PROCESS_WORKERS = int(os.environ.get('PROCESS_WORKERS', os.cpu_count() or 1))
+# Learns processing time per stage from finished jobs
+estimator = ProcessingTimeEstimator(workers=PROCESS_WORKERS)
+# Shadow comparisons reported by the pool workers
+shadow_stats = ShadowStats()
+# One budget for the whole pool, enforced here before work reaches a process
+governor = ResourceGovernor(max_jobs=int(os.environ.get('GOVERNOR_MAX_JOBS', PROCESS_WORKERS)))
+
+
+@pass_context
+def url_for(context, name, **params):
+    """Flask-style url_for so the Flask templates render unchanged"""
+    if name == 'static' and 'filename' in params:
+        params = {'path': params.pop('filename')}
+    return context['request'].url_for(name, **params).path
+
+
+templates = Jinja2Templates(directory='templates')
+templates.env.globals['url_for'] = url_for
+templates.env.globals['get_flashed_messages'] = lambda: []
+
+
+def error_stream(message):
+    return StreamingResponse(iter([send_result({'success': False, 'message': message})]),
+                             media_type='text/event-stream')
+
+
+async def index(request):
+    return templates.TemplateResponse(request, 'index.html')
+
+
+async def healthz(request):
+    return JSONResponse({'status': 'ok'})
+
+
+async def readyz(request):
+    return JSONResponse(warmup.readiness.status(),
+                        status_code=200 if warmup.readiness.ready else 503)
+
+
+async def estimator_stats(request):
+    return JSONResponse(estimator.stats())
+
+
+async def model_stats(request):
+    # Models are loaded in the pool workers; this process only reads the routing config
+    routes, shadow = read_config(predict.MODEL_ROOT, os.environ.get('ADHD_MODEL_REGISTRY'))
+    return JSONResponse({'routes': routes, 'shadow': shadow,
+                         'shadow_stats': shadow_stats.summary()})
+
+
+async def governor_stats(request):
+    return JSONResponse(governor.stats())
+
+
+async def upload_file(request):
+    # Reject oversized uploads before reading the body
+    try:
+        content_length = int(request.headers.get('content-length') or 0)
+    except ValueError:
+        return error_stream('Invalid Content-Length header')
+    if content_length > MAX_CONTENT_LENGTH:
+        return error_stream(f'File too large. Maximum size is {MAX_CONTENT_LENGTH // (1024*1024)}MB')
+
+    try:
+        form = await request.form(max_files=1)
+    except Exception as e:
+        return error_stream(f'Server error: {str(e)}')
+
+    file = form.get('file')
+    if file is None or isinstance(file, str):
+        return error_stream('No file part')
+    if file.filename == '':
+        return error_stream('No selected file')
+
+    # Check file extension
+    if not allowed_file(file.filename):
+        return error_stream('Invalid file type. Only MP3 and WAV files are allowed.')
+
+    # Unique name so concurrent uploads of the same file name never collide
+    filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
+    filepath = os.path.join(UPLOAD_FOLDER, filename)
+    if len(filepath) > MAX_CONTENT_PATH:
+        return error_stream('File path too long')
+
+    # Copy the spooled upload to disk in chunks while hashing it
+    content_hash, _ = await run_in_threadpool(save_and_hash, file.file, filepath, MAX_CONTENT_LENGTH)
+    await file.close()
+    if content_hash is None:
+        return error_stream(f'File too large. Maximum size is {MAX_CONTENT_LENGTH // (1024*1024)}MB')
+
+    # Profiled uploads always run on their own so the profile covers the whole pipeline
+    if profiling.requested(request.headers, request.query_params):
+        job = AsyncJob(content_hash)
+        profile_id = profiling.new_request_id()
+        print(f"Profiling upload as request {profile_id}")
+        job.task = asyncio.create_task(run_job(job, filepath, profile_id))
+        return StreamingResponse(job.subscribe(), media_type='text/event-stream',
+                                 headers={'X-Request-Id': profile_id})
+
+    # Identical audio already in progress: follow that job instead
+    job, is_leader = inflight.acquire(content_hash)
+    if is_leader:
+        # Keep a reference so the task is not garbage collected mid-run
+        job.task = asyncio.create_task(run_job(job, filepath))
+    else:
+        print(f"Coalescing upload with in-flight job {content_hash[:12]}")
+        os.remove(filepath)
+
+    return StreamingResponse(job.subscribe(), media_type='text/event-stream')
+
+
+async def run_job(job, filepath, profile_id=None):
+    """
+    Run the pipeline in the process pool and publish its events to every subscriber
+
+    A profiled job (profile_id set) is profiled inside the pool worker and
+    is not registered in inflight.
+    """
+    loop = asyncio.get_running_loop()
+    plan = None
+    try:
+        start = time.perf_counter()
+        # Only the file header is read, so this stays off the process pool
+        description = await run_in_threadpool(describe_file, filepath)
+        estimate_time = estimator.estimate(description, queue_depth=len(inflight) - 1)
+        job.publish(send_estimate_time(max(1, round(estimate_time))))
+        # Waits for memory/CPU budget; the plan may shorten or thin out the analysis
+        plan = await run_in_threadpool(governor.admit, description)
+
+        executor = pool
+        if profile_id:
+            # Profiler overhead would skew the estimator, so it does not learn from this run
+            result = await loop.run_in_executor(executor, profiling.analyse_file_profiled,
+                                                filepath, job.key, profile_id, plan)
+        else:
+            result = await loop.run_in_executor(executor, predict.analyse_file,
+                                                filepath, job.key, plan)
+            # Degraded runs analyse less audio than the file describes
+            if not result.get('degraded'):
+                estimator.observe(description, result.get('timings', {}), estimate_time,
+                                  time.perf_counter() - start)
+        # Candidate outputs are aggregated here and not shown to users
+        for record in result.pop('shadow', []):
+            shadow_stats.add(record)
+        print(result)
+        job.publish(send_result(result, True), final=True)
+
+    except Overloaded as e:
+        job.publish(send_result({'success': False, 'message': str(e)}), final=True)
+    except BrokenProcessPool:
+        rebuild_pool(executor)
+        job.publish(send_result({
+            'success': False,
+            'message': 'The analysis worker stopped unexpectedly, please try again'
+        }), final=True)
+    except Exception as e:
+        job.publish(send_result({
+            'success': False,
+            'message': f'Error processing file: {str(e)}'
+        }), final=True)
+    finally:
+        if plan is not None:
+            governor.release(plan)
+        if not profile_id:
+            inflight.release(job.key)
+        # Clean up
+        if os.path.exists(filepath):
+            os.remove(filepath)
+
+
+def new_pool():
+    # Spawned workers do not inherit the event loop's threads or sockets
+    return ProcessPoolExecutor(max_workers=PROCESS_WORKERS,
+                               mp_context=multiprocessing.get_context('spawn'),
+                               initializer=profiling.start_continuous)
+
+
+def rebuild_pool(broken):
+    """
+    Replace a pool whose worker died and warm the new one
+
+    Every job running in the broken pool fails at the same time; only the
+    first one to get here replaces it. /readyz reports warming until the
+    new workers are ready.
+    """
+    global pool, warming
+    if pool is not broken:
+        return
+    print("A pool worker died, starting a new process pool")
+    if warming is not None:
+        warming.cancel()
+    warmup.readiness.set('warming')
+    broken.shutdown(wait=False, cancel_futures=True)
+    pool = new_pool()
+    warming = asyncio.create_task(warm_pool())
+
+
+async def warm_pool(rounds=5):
+    """
+    Warm every process of the pool before reporting ready
+
+    The pool spawns a worker per concurrent task, and a worker busy warming
+    up cannot take a second task, so one task per worker normally reaches
+    every process; workers that were missed get another round.
+    """
+    loop = asyncio.get_running_loop()
+    warmup.readiness.set('warming')
+    start = time.perf_counter()
+    warm_pids = set()
+    try:
+        for _ in range(rounds):
+            pids = await asyncio.gather(*[loop.run_in_executor(pool, warmup.warm_process)
+                                          for _ in range(PROCESS_WORKERS)])
+            warm_pids.update(pids)
+            if len(warm_pids) >= PROCESS_WORKERS:
+                break
+        seconds = time.perf_counter() - start
+        warmup.readiness.set('ready', seconds=seconds)
+        print(f"Warmed {len(warm_pids)} pool workers in {seconds:.2f}s")
+    except Exception as e:
+        warmup.readiness.set('failed', error=str(e))
+        print(f"Warm-up failed: {str(e)}")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global pool, warming
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    pool = new_pool()
+    # Serve /healthz and /readyz while the workers warm up
+    warming = asyncio.create_task(warm_pool())
+    try:
+        yield
+    finally:
+        warming.cancel()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+app = Starlette(
+    routes=[
+        Route('/', index),
+        Route('/healthz', healthz),
+        Route('/readyz', readyz),
+        Route('/estimator', estimator_stats),
+        Route('/models', model_stats),
+        Route('/governor', governor_stats),
+        Route('/upload_file', upload_file, methods=['POST']),
+        Mount('/static', StaticFiles(directory='static'), name='static'),
+    ],
+    lifespan=lifespan,
+)
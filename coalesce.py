@@ -0,0 +1,139 @@
+import os
+import asyncio
+import hashlib
+import threading
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def save_and_hash(stream, filepath, max_size, chunk_size=CHUNK_SIZE):
+    """
+    Copy an upload stream to disk while computing its content hash
+
+    Args:
+        stream: File-like object with read(size)
+        filepath (str): Destination path
+        max_size (int): Maximum accepted size in bytes
+        chunk_size (int): Bytes read per chunk
+
+    Returns:
+        tuple: (sha256 hex digest, size in bytes), or (None, size) if the
+            upload was larger than max_size; the partial file is removed then
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(filepath, 'wb') as out:
+        while chunk := stream.read(chunk_size):
+            size += len(chunk)
+            if size > max_size:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+    if size > max_size:
+        os.remove(filepath)
+        return None, size
+    return digest.hexdigest(), size
+
+
+class Job:
+    """
+    One in-flight pipeline run whose events are replayed to every subscriber
+
+    The leader publishes events (estimate, result) from a worker thread;
+    any number of request generators can subscribe, including ones that
+    attach after some events were already published.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.events = []
+        self.done = False
+        self._cond = threading.Condition()
+
+    def publish(self, event, final=False):
+        with self._cond:
+            self.events.append(event)
+            self.done = self.done or final
+            self._cond.notify_all()
+
+    def subscribe(self):
+        position = 0
+        while True:
+            with self._cond:
+                while position >= len(self.events) and not self.done:
+                    self._cond.wait()
+                pending = self.events[position:]
+                done = self.done
+            for event in pending:
+                yield event
+            position += len(pending)
+            if done and position >= len(self.events):
+                return
+
+
+class AsyncJob:
+    """Event-loop version of Job for the ASGI app"""
+
+    def __init__(self, key):
+        self.key = key
+        self.events = []
+        self.done = False
+        self._changed = asyncio.Event()
+
+    def publish(self, event, final=False):
+        self.events.append(event)
+        self.done = self.done or final
+        # Wake every waiting subscriber, then arm a fresh event for the next publish
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self):
+        position = 0
+        while True:
+            while position < len(self.events):
+                yield self.events[position]
+                position += 1
+            if self.done:
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+    """
+    Registry of in-flight jobs keyed by the upload's content hash
+
+    The first request for a key becomes the leader and runs the pipeline;
+    later requests for the same key attach to the leader's job instead of
+    starting new work. The key is released when the job finishes, so a
+    later upload of the same audio is processed again.
+    """
+
+    def __init__(self, job_class=Job):
+        self.job_class = job_class
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """
+        Join the in-flight job for key, or register a new one
+
+        Args:
+            key (str): Content hash of the upload
+
+        Returns:
+            tuple: (job, True if the caller is the leader and must run it)
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None:
+                return job, False
+            job = self._jobs[key] = self.job_class(key)
+            return job, True
+
+    def release(self, key):
+        with self._lock:
+            self._jobs.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._jobs)
@@ -10,6 +10,10 @@ from sklearn.decomposition import PCA
 import matplotlib.pyplot as plt
 import seaborn as sns
 import shutil
+import time
+import vad
+from feature_sets import get_smile
+from profiling import stage
 
 def split_number(input_file,segment_length_seconds=60):
     y,sr = librosa.load(input_file)
@@ -17,7 +21,7 @@ def split_number(input_file,segment_length_seconds=60):
     total_segments = len(y) // segment_length_samples + (1 if len(y) % segment_length_samples != 0 else 0)
     return total_segments
 
-def split_audio(input_file, output_dir, segment_length_seconds=60):
+def split_audio(input_file, output_dir, segment_length_seconds=60, use_vad=False):
     """
     Split an audio file into segments of specified length
     
@@ -25,6 +29,10 @@ def split_audio(input_file, output_dir, segment_length_seconds=60):
         input_file (str): Path to the input audio file
         output_dir (str): Directory to save the split audio files
         segment_length_seconds (int): Length of each segment in seconds
+        use_vad (bool): Drop silence/noise first and split only the joined speech
+        
+    Returns:
+        dict: Voice activity report (None when use_vad is False)
     """
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
@@ -33,6 +41,16 @@ def split_audio(input_file, output_dir, segment_length_seconds=60):
     print(f"Loading audio file: {input_file}")
     y, sr = librosa.load(input_file)
     
+    # Drop non-speech regions before segmenting
+    vad_report = None
+    if use_vad:
+        y, vad_report = vad.keep_speech(y, sr)
+        print(f"Voice activity: kept {vad_report['speech_seconds']:.2f}s, "
+              f"discarded {vad_report['discarded_seconds']:.2f}s "
+              f"({vad_report['discarded_ratio']:.1%})")
+        if len(y) == 0:
+            raise ValueError("No speech detected in the recording")
+    
     # Calculate segment length in samples
     segment_length_samples = int(segment_length_seconds * sr)
     
@@ -58,6 +76,8 @@ def split_audio(input_file, output_dir, segment_length_seconds=60):
         
         # Export segment
         sf.write(output_path, segment, sr)
+    
+    return vad_report
 
 def resample_audio(input_file, output_file, target_sr=16000):
     """
@@ -126,7 +146,90 @@ def extract_egemaps(audio_file):
     features = smile.process_file(audio_file)
     return features.values[0]
 
-def process_audio_files(input_file, output_dir=r"processed", segment_length=60):
+def load_signal(input_file, target_sr=16000, duration=None, res_type='soxr_hq'):
+    """
+    Decode and resample an audio file in one step
+    
+    Args:
+        input_file (str): Path to the input audio file
+        target_sr (int): Target sampling rate
+        duration (float): Decode only the first duration seconds (optional);
+            bounds the memory used for long uploads
+        res_type (str): librosa resampler, e.g. 'soxr_lq' to trade quality for speed
+        
+    Returns:
+        tuple: (contiguous mono float32 signal, sampling rate)
+    """
+    y, sr = librosa.load(input_file, sr=target_sr, mono=True, dtype=np.float32,
+                         duration=duration, res_type=res_type)
+    return np.ascontiguousarray(y), sr
+
+def extract_features(y, sr, segment_length=60, use_vad=vad.USE_VAD, max_segments=None):
+    """
+    In-memory serving path: VAD, segmentation and eGeMAPs extraction
+    
+    This is the path used for live requests. Nothing is written to disk and
+    no pandas objects are built. Buffers allocated per request:
+    
+    1. load_signal: the decoded signal and its 16 kHz float32 resample
+    2. VAD: one contiguous copy of the speech, skipped when the speech is
+       a single region
+    3. Segments: none, each segment is a view into the speech buffer
+       (openSMILE itself converts each segment to int16 internally)
+    4. Features: one preallocated (n_segments, 88) float32 array that
+       openSMILE's output rows are written into
+    
+    Args:
+        y (numpy.ndarray): Contiguous mono float32 signal from load_signal
+        sr (int): Sampling rate (must be 16000)
+        segment_length (int): Length of each segment in seconds
+        use_vad (bool): Remove silence and noise-only stretches before splitting;
+            must match the setting the model's training features were extracted with
+        max_segments (int): Analyse at most this many evenly spaced segments (optional)
+        
+    Returns:
+        tuple: (features array, voice activity report or None, stage timings dict,
+            segment counts {'total', 'analysed'})
+    """
+    timings = {}
+    vad_report = None
+    if use_vad:
+        start = time.perf_counter()
+        with stage('vad'):
+            y, vad_report = vad.keep_speech(y, sr)
+        timings['vad'] = time.perf_counter() - start
+        if len(y) == 0:
+            raise ValueError("No speech detected in the recording")
+    
+    segment_length_samples = int(segment_length * sr)
+    total_segments = -(-len(y) // segment_length_samples)
+    indices = np.arange(total_segments)
+    if max_segments and total_segments > max_segments:
+        # Spread the sample over the whole recording
+        indices = np.unique(np.linspace(0, total_segments - 1, max_segments).round().astype(int))
+    segments = {'total': int(total_segments), 'analysed': int(len(indices))}
+    
+    with stage('extract'):
+        smile = get_smile(opensmile.FeatureSet.eGeMAPSv02, opensmile.FeatureLevel.Functionals)
+        features = np.empty((len(indices), smile.num_features), dtype=np.float32)
+        
+        start = time.perf_counter()
+        for row, i in enumerate(indices):
+            segment = y[i * segment_length_samples:(i + 1) * segment_length_samples]
+            # smile() returns a raw (channels, features, frames) array
+            features[row] = smile(segment, sr)[0, :, 0]
+    timings['extract'] = time.perf_counter() - start
+    
+    # openSMILE fills segments too short to analyse with NaN
+    valid = ~np.isnan(features).any(axis=1)
+    if not valid.all():
+        features = features[valid]
+        if len(features) == 0:
+            raise ValueError("Recording too short to extract features")
+    
+    return features, vad_report, timings, segments
+
+def process_audio_files(input_file, output_dir=r"processed", segment_length=60, use_vad=vad.USE_VAD):
     """
     Process audio file: split, resample, and extract features
     
@@ -134,7 +237,13 @@ def process_audio_files(input_file, output_dir=r"processed", segment_length=60):
         input_file (str): Path to the input audio file
         output_dir (str): Base directory for outputs
         segment_length (int): Length of each segment in seconds
+        use_vad (bool): Remove silence and noise-only stretches before splitting
+        
+    Returns:
+        pd.DataFrame: Features per segment; df.attrs['vad'] holds the voice activity
+            report and df.attrs['timings'] the seconds spent in each stage
     """
+    timings = {}
     # Create necessary directories
     split_dir = os.path.join(output_dir, 'split')
     resampled_dir = os.path.join(output_dir, 'resampled')
@@ -153,14 +262,19 @@ def process_audio_files(input_file, output_dir=r"processed", segment_length=60):
     
     # Step 1: Split audio
     print("\nStep 1: Splitting audio file...")
-    split_audio(input_file, split_dir, segment_length)
+    start = time.perf_counter()
+    vad_report = split_audio(input_file, split_dir, segment_length, use_vad=use_vad)
+    timings['decode'] = time.perf_counter() - start
     
     # Step 2: Resample segments
     print("\nStep 2: Resampling segments to 16kHz...")
+    start = time.perf_counter()
     process_directory(split_dir, resampled_dir, target_sr=16000)
+    timings['resample'] = time.perf_counter() - start
     
     # Step 3: Extract features
     print("\nStep 3: Extracting eGeMAPs features...")
+    start = time.perf_counter()
     all_features = []
     file_names = []
     
@@ -173,6 +287,7 @@ def process_audio_files(input_file, output_dir=r"processed", segment_length=60):
             file_names.append(audio_file)
         except Exception as e:
             print(f"Error processing {audio_file}: {str(e)}")
+    timings['extract'] = time.perf_counter() - start
     
     # Create DataFrame with features
     feature_names = opensmile.Smile(
@@ -182,6 +297,8 @@ def process_audio_files(input_file, output_dir=r"processed", segment_length=60):
     ).feature_names
     
     df = pd.DataFrame(all_features, index=file_names, columns=feature_names)
+    df.attrs['vad'] = vad_report
+    df.attrs['timings'] = timings
     
     # Save features
     features_file = os.path.join(output_dir, 'features.csv')
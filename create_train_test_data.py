@@ -5,7 +5,11 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
 import opensmile
 import librosa
+import matplotlib
+matplotlib.use('Agg')  # Headless backend: figures are only saved, never shown
 import matplotlib.pyplot as plt
+import feature_sets
+import vad
 
 def get_feature_names():
     """
@@ -44,12 +48,13 @@ def resample_audio(audio_file, target_sr=16000):
     
     return y, target_sr
 
-def extract_egemaps(audio_file):
+def extract_egemaps(audio_file, use_vad=vad.USE_VAD):
     """
     Extract eGeMAPs features from an audio file
     
     Args:
         audio_file (str): Path to the audio file
+        use_vad (bool): Drop silence and noise-only stretches first
         
     Returns:
         numpy.ndarray: Array of eGeMAPs features
@@ -62,7 +67,14 @@ def extract_egemaps(audio_file):
     )
 
     # Extract features
-    features = smile.process_file(audio_file)
+    if use_vad:
+        y, sr = librosa.load(audio_file, sr=16000)
+        y, _ = vad.keep_speech(y, sr)
+        if len(y) == 0:
+            raise ValueError("No speech detected in the recording")
+        features = smile.process_signal(y, sr)
+    else:
+        features = smile.process_file(audio_file)
     return features.values[0]
 def get_label(filename):
     """
@@ -76,13 +88,22 @@ def get_label(filename):
     """
     return 1 if 'adhd' in filename.lower() else 0
 
-def process_audio_directory(input_dir, output_file):
+def process_audio_directory(input_dir, output_file, set_names=None, use_vad=vad.USE_VAD):
     """
     Process all audio files in a directory and extract eGeMAPs features
     
+    Serving drops silence before extraction only when ADHD_USE_VAD=1 (see
+    vad.USE_VAD). Features for a model must be extracted with the same
+    setting the server will use, which is what use_vad defaults to; pass
+    the same setting to train.py (--vad/--no-vad) so it is recorded with
+    the model.
+    
     Args:
         input_dir (str): Directory containing audio files
         output_file (str): Path to save the features CSV file
+        set_names (list): Feature sets from feature_sets.FEATURE_SETS to compute
+            together from one decode (optional, default is eGeMAPS functionals)
+        use_vad (bool): Drop silence and noise-only stretches before extraction
         
     Returns:
         tuple: (DataFrame with features, list of labels)
@@ -101,8 +122,11 @@ def process_audio_directory(input_dir, output_file):
         file_path = os.path.join(input_dir, audio_file)
         
         try:
-            # Extract eGeMAPs features
-            features = extract_egemaps(file_path)
+            # Extract eGeMAPs features (or the requested feature sets)
+            if set_names:
+                features = feature_sets.extract_file(file_path, set_names, use_vad=use_vad)
+            else:
+                features = extract_egemaps(file_path, use_vad=use_vad)
             label = get_label(audio_file)
             
             all_features.append(features)
@@ -116,7 +140,7 @@ def process_audio_directory(input_dir, output_file):
         raise ValueError("No features were successfully extracted from any files")
     
     # Get feature names from opensmile
-    feature_names = get_feature_names()
+    feature_names = feature_sets.feature_names(set_names) if set_names else get_feature_names()
     
     # Convert to DataFrame with named columns
     df = pd.DataFrame(all_features, index=file_names, columns=feature_names)
@@ -173,7 +197,7 @@ def PCA_analysis(df):
     plt.legend(loc='best')
     plt.grid()
     plt.savefig('pca_test_variance_plot.png')
-    plt.show()
+    plt.close()
 
     # Step 5: Print Component Information
     print("\nPCA Component Information:")
@@ -181,9 +205,9 @@ def PCA_analysis(df):
         print(f"PC{i+1}: {ratio*100:.2f}% (Cumulative: {cum_ratio*100:.2f}%)")
 
     # Step 6: Retain Selected Components
-    # Re-fit PCA with the selected number of components
-    pca_reduced = PCA(n_components=32)
-    X_pca_reduced = pca_reduced.fit_transform(X_scaled)
+    # The full fit already holds every component, so keep the leading ones
+    # instead of re-fitting PCA(n_components=32) on the same data
+    X_pca_reduced = X_pca[:, :32]
 
     # Create DataFrame with reduced PCA components and labels
     pca_df = pd.DataFrame(
@@ -207,7 +231,7 @@ def PCA_analysis(df):
     plt.title('PCA Components 1 vs 2 (Colored by ADHD Label)')
     plt.colorbar(label='ADHD Label')
     plt.savefig('pca_test_components_plot.png')
-    plt.show()
+    plt.close()
         
         
 
@@ -220,7 +244,7 @@ def main():
         # Extract eGeMAPs features and get labels
         print("Extracting eGeMAPs features...")
         features_df, labels = process_audio_directory(input_dir, features_file)
-        PCA_analysis(features_df, labels)
+        PCA_analysis(features_df)
     except Exception as e:
         print(f"An error occurred: {str(e)}")
 
@@ -0,0 +1,458 @@
+"""
+Distributed batch feature extraction
+
+A coordinator shards the file manifest into work units and hands them to
+a broker. Workers on any number of nodes lease units, extract features and
+commit each unit as one block of the shared FeatureStore. The block id is
+the unit id, so a unit that is retried after a crash or lease timeout is
+either committed already (and simply acknowledged) or written again from
+scratch; it can never be half-visible or duplicated.
+
+The broker is a multiprocessing manager server, so the same code runs
+everything on one box (local) or across nodes that can reach the
+coordinator over TCP and share the feature store directory:
+
+    python distributed.py local dataset/train_16k --store feature_store --workers 4
+
+    export BROKER_AUTHKEY=<long random secret, same on every node>
+    python distributed.py serve dataset/train_16k --address 0.0.0.0:50000   # coordinator
+    python distributed.py work --address coordinator:50000 --store /shared/feature_store --workers 8
+
+The manager protocol exchanges pickles, so anyone who can connect with the
+key can run code on the coordinator. serve and work refuse to start without
+BROKER_AUTHKEY, serve listens on 127.0.0.1 unless another address is given,
+and the port should only be reachable from the worker nodes. local uses a
+random key that never leaves the machine.
+"""
+import os
+import time
+import socket
+import hashlib
+import argparse
+import threading
+import multiprocessing
+from collections import deque
+from multiprocessing.managers import BaseManager
+
+import numpy as np
+
+import vad
+import feature_sets
+from feature_store import FeatureStore
+
+DEFAULT_ADDRESS = ('127.0.0.1', 50000)
+
+
+def broker_authkey():
+    """
+    Shared secret for multi-node runs, read from BROKER_AUTHKEY
+
+    Returns:
+        bytes: The key
+
+    Raises:
+        ValueError: If BROKER_AUTHKEY is not set
+    """
+    key = os.environ.get('BROKER_AUTHKEY')
+    if not key:
+        raise ValueError("Set BROKER_AUTHKEY to the same secret on the coordinator "
+                         "and every worker node")
+    return key.encode()
+
+
+def build_manifest(input_dir):
+    """
+    List the audio files to extract
+
+    Args:
+        input_dir (str): Directory containing audio files
+
+    Returns:
+        list: Absolute file paths, sorted so every run shards the same way
+    """
+    return sorted(os.path.abspath(os.path.join(input_dir, f))
+                  for f in os.listdir(input_dir) if f.endswith(('.mp3', '.wav')))
+
+
+def shard_manifest(files, unit_size=16):
+    """
+    Split a manifest into work units with stable ids
+
+    The id hashes the file names and sizes, so re-running the coordinator
+    on the same corpus produces the same units and skips committed ones.
+
+    Args:
+        files (list): Paths from build_manifest
+        unit_size (int): Files per unit
+
+    Returns:
+        list: Units as dicts {'id': str, 'files': list}
+    """
+    units = []
+    for start in range(0, len(files), unit_size):
+        chunk = files[start:start + unit_size]
+        digest = hashlib.sha256()
+        for path in chunk:
+            digest.update(f"{os.path.basename(path)}:{os.path.getsize(path)}\n".encode())
+        units.append({'id': f"unit-{digest.hexdigest()[:16]}", 'files': chunk})
+    return units
+
+
+class InMemoryBroker:
+    """
+    Work queue with leases, retries and a dead-letter list
+
+    A leased unit that is not acknowledged within lease_seconds goes back
+    to the queue; a unit that fails or times out max_attempts times is
+    parked in 'failed' with its last error. Only the worker currently
+    holding a unit's lease can ack or nack it, so a worker whose lease
+    expired cannot disturb the retry that replaced it.
+    """
+
+    def __init__(self, lease_seconds=600, max_attempts=3):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._pending = deque()
+        self._leases = {}
+        self._attempts = {}
+        self._known = set()
+        self._done = set()
+        self._failed = {}
+        self._lock = threading.Lock()
+
+    def submit(self, units):
+        """Queue units that were not submitted before; returns how many were new"""
+        added = 0
+        with self._lock:
+            for unit in units:
+                if unit['id'] not in self._known:
+                    self._known.add(unit['id'])
+                    self._pending.append(unit)
+                    added += 1
+        return added
+
+    def _retry_or_fail(self, unit, error):
+        if self._attempts.get(unit['id'], 0) < self.max_attempts:
+            self._pending.append(unit)
+        else:
+            self._failed[unit['id']] = error
+
+    def _requeue_expired(self):
+        # A worker killed mid-unit (OOM, native crash) never nacks; its lease expiring
+        # counts as a failed attempt so the unit cannot be retried forever
+        now = time.monotonic()
+        for unit_id, (unit, worker_id, deadline) in list(self._leases.items()):
+            if deadline < now:
+                print(f"Lease on {unit_id} held by {worker_id} expired")
+                del self._leases[unit_id]
+                self._retry_or_fail(unit, f"lease expired while held by {worker_id}")
+
+    def _release(self, unit_id, worker_id):
+        """Remove and return the lease if worker_id holds it, else None"""
+        lease = self._leases.get(unit_id)
+        if lease is None or lease[1] != worker_id:
+            return None
+        return self._leases.pop(unit_id)
+
+    def lease(self, worker_id):
+        """Hand the next unit to a worker, or None if nothing is pending"""
+        with self._lock:
+            self._requeue_expired()
+            if not self._pending:
+                return None
+            unit = self._pending.popleft()
+            self._attempts[unit['id']] = self._attempts.get(unit['id'], 0) + 1
+            self._leases[unit['id']] = (unit, worker_id, time.monotonic() + self.lease_seconds)
+            return unit
+
+    def ack(self, unit_id, worker_id):
+        """Mark a unit done; returns False if worker_id no longer holds its lease"""
+        with self._lock:
+            if self._release(unit_id, worker_id) is None:
+                return False
+            self._done.add(unit_id)
+            return True
+
+    def nack(self, unit_id, worker_id, error):
+        """Give a unit back for retry; returns False if worker_id no longer holds its lease"""
+        with self._lock:
+            lease = self._release(unit_id, worker_id)
+            if lease is None:
+                return False
+            self._retry_or_fail(lease[0], error)
+            return True
+
+    def finished(self):
+        with self._lock:
+            self._requeue_expired()
+            return not self._pending and not self._leases
+
+    def status(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'leased': len(self._leases),
+                'done': len(self._done),
+                'failed': dict(self._failed),
+            }
+
+
+_broker = None
+
+
+def _get_broker(lease_seconds=600, max_attempts=3):
+    """Broker singleton living in the manager's server process"""
+    global _broker
+    if _broker is None:
+        _broker = InMemoryBroker(lease_seconds, max_attempts)
+    return _broker
+
+
+class BrokerManager(BaseManager):
+    pass
+
+
+BrokerManager.register('get_broker', callable=_get_broker)
+
+
+def connect(address, authkey):
+    """Proxy to a broker served by a coordinator at (host, port)"""
+    manager = BrokerManager(address=address, authkey=authkey)
+    manager.connect()
+    return manager.get_broker()
+
+
+def extract_unit(unit, set_names, labelled=True, use_vad=vad.USE_VAD):
+    """
+    Extract features for every file of a unit
+
+    Unlike process_audio_directory, a file that fails is not skipped: the
+    block is stored under the unit id and a stored block is never redone,
+    so a partial block would lose the failed files for good. Every file is
+    still tried, so the error names all of the failures at once.
+
+    Args:
+        unit (dict): Work unit from shard_manifest
+        set_names (list): Keys of feature_sets.FEATURE_SETS
+        labelled (bool): Derive labels from file names
+        use_vad (bool): Drop silence first; must match the serving setting
+
+    Returns:
+        tuple: (features float32 array, labels or None, file names)
+
+    Raises:
+        RuntimeError: If any file of the unit failed
+    """
+    from create_train_test_data import get_label
+
+    rows, labels, names, errors = [], [], [], []
+    for path in unit['files']:
+        try:
+            rows.append(feature_sets.extract_file(path, set_names, use_vad=use_vad))
+            labels.append(get_label(os.path.basename(path)))
+            names.append(os.path.basename(path))
+        except Exception as e:
+            print(f"Error processing {path}: {str(e)}")
+            errors.append(f"{path}: {str(e)}")
+    if errors:
+        raise RuntimeError(f"{len(errors)} of {len(unit['files'])} files failed: "
+                           + "; ".join(errors))
+    X = np.vstack(rows) if rows else np.empty((0, len(feature_sets.feature_names(set_names))),
+                                              dtype=np.float32)
+    return X, (labels if labelled else None), names
+
+
+def run_worker(address, authkey, store_dir, set_names=('egemaps',), labelled=True,
+               use_vad=vad.USE_VAD, poll_seconds=2.0):
+    """
+    Lease units from the broker until all work is finished
+
+    A unit whose files do not all extract is nacked without storing
+    anything, so the broker retries it and, if it keeps failing, reports
+    the failed files in status()['failed'].
+
+    Args:
+        address (tuple): (host, port) of the broker
+        authkey (bytes): Broker authentication key
+        store_dir (str): Shared FeatureStore directory
+        set_names (list): Keys of feature_sets.FEATURE_SETS
+        labelled (bool): Derive labels from file names
+        use_vad (bool): Drop silence first; every worker of a run must agree
+        poll_seconds (float): Wait between polls when nothing is pending
+    """
+    broker = connect(address, authkey)
+    store = FeatureStore(store_dir)
+    names = feature_sets.feature_names(list(set_names))
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    processed = 0
+    while True:
+        unit = broker.lease(worker_id)
+        if unit is None:
+            if broker.finished():
+                break
+            time.sleep(poll_seconds)
+            continue
+
+        # A previous attempt may have committed the block before dying
+        if store.has_block(unit['id']):
+            broker.ack(unit['id'], worker_id)
+            continue
+
+        try:
+            X, y, index = extract_unit(unit, list(set_names), labelled, use_vad)
+            if len(X):
+                store.put_block(X, y=y, index=index, feature_names=names, block_id=unit['id'])
+            if not broker.ack(unit['id'], worker_id):
+                # The block is committed; the retry that took over will find it and ack
+                print(f"Worker {worker_id} lost the lease on {unit['id']} before finishing")
+            processed += 1
+        except Exception as e:
+            print(f"Worker {worker_id} failed on {unit['id']}: {str(e)}")
+            broker.nack(unit['id'], worker_id, str(e))
+
+    print(f"Worker {worker_id} finished after {processed} units")
+
+
+def wait_for_completion(broker, poll_seconds=5.0):
+    """Print progress until every unit is done or failed; returns the final status"""
+    while not broker.finished():
+        status = broker.status()
+        print(f"pending={status['pending']} leased={status['leased']} "
+              f"done={status['done']} failed={len(status['failed'])}")
+        time.sleep(poll_seconds)
+    status = broker.status()
+    print(f"\nExtraction finished: {status['done']} units done, {len(status['failed'])} failed")
+    for unit_id, error in status['failed'].items():
+        print(f"  {unit_id}: {error}")
+    return status
+
+
+def run_local(input_dir, store_dir, workers=2, unit_size=16, set_names=('egemaps',),
+              labelled=True, use_vad=vad.USE_VAD):
+    """
+    Run the coordinator, broker and several worker processes on one machine
+
+    Args:
+        input_dir (str): Directory containing audio files
+        store_dir (str): FeatureStore directory
+        workers (int): Worker processes
+        unit_size (int): Files per work unit
+        set_names (list): Keys of feature_sets.FEATURE_SETS
+        labelled (bool): Derive labels from file names
+        use_vad (bool): Drop silence first; must match the serving setting
+
+    Returns:
+        dict: Final broker status
+    """
+    # Random key: only this process and its workers ever see it
+    authkey = os.urandom(32)
+    manager = BrokerManager(address=('127.0.0.1', 0), authkey=authkey)
+    manager.start()
+    try:
+        broker = manager.get_broker()
+        units = shard_manifest(build_manifest(input_dir), unit_size)
+        print(f"Submitted {broker.submit(units)} units")
+
+        processes = [multiprocessing.Process(target=run_worker,
+                                             args=(manager.address, authkey, store_dir,
+                                                   set_names, labelled, use_vad))
+                     for _ in range(workers)]
+        for process in processes:
+            process.start()
+        status = wait_for_completion(broker, poll_seconds=1.0)
+        for process in processes:
+            process.join()
+        return status
+    finally:
+        manager.shutdown()
+
+
+def serve(input_dir, address, authkey, unit_size=16, lease_seconds=600):
+    """
+    Coordinator for multi-node runs: shard the manifest and serve the broker
+
+    Args:
+        input_dir (str): Directory containing audio files (same path on every node)
+        address (tuple): (host, port) to listen on
+        authkey (bytes): Secret the worker nodes authenticate with
+        unit_size (int): Files per work unit
+        lease_seconds (int): Seconds before an unacknowledged unit is requeued
+
+    Returns:
+        dict: Final broker status
+    """
+    broker = _get_broker(lease_seconds=lease_seconds)
+    units = shard_manifest(build_manifest(input_dir), unit_size)
+    print(f"Submitted {broker.submit(units)} units, serving broker on {address[0]}:{address[1]}")
+
+    server = BrokerManager(address=address, authkey=authkey).get_server()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    status = wait_for_completion(broker)
+    # Leave workers time to see that everything is finished before exiting
+    time.sleep(5)
+    return status
+
+
+def parse_address(value):
+    host, port = value.rsplit(':', 1)
+    return host, int(port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed feature extraction")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    local_parser = subparsers.add_parser('local', help="Broker and workers on this machine")
+    local_parser.add_argument('input_dir')
+    local_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+
+    serve_parser = subparsers.add_parser('serve', help="Coordinator/broker for multi-node runs")
+    serve_parser.add_argument('input_dir')
+    serve_parser.add_argument('--address', type=parse_address, default=DEFAULT_ADDRESS,
+                              help="host:port to listen on; use 0.0.0.0 only on a trusted network")
+    serve_parser.add_argument('--lease-seconds', type=int, default=600)
+
+    work_parser = subparsers.add_parser('work', help="Worker processes on this node")
+    work_parser.add_argument('--address', type=parse_address, required=True)
+    work_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+
+    for sub in (local_parser, serve_parser, work_parser):
+        sub.add_argument('--store', default='feature_store')
+        sub.add_argument('--unit-size', type=int, default=16)
+        sub.add_argument('--sets', nargs='+', default=['egemaps'],
+                         choices=sorted(feature_sets.FEATURE_SETS))
+        sub.add_argument('--unlabelled', action='store_true',
+                         help="Do not derive labels from file names")
+    for sub in (local_parser, work_parser):
+        sub.add_argument('--vad', action=argparse.BooleanOptionalAction, default=vad.USE_VAD,
+                         help="Drop silence before extraction; must match the server's "
+                              "ADHD_USE_VAD setting")
+
+    args = parser.parse_args()
+    if args.command in ('serve', 'work'):
+        try:
+            authkey = broker_authkey()
+        except ValueError as e:
+            parser.error(str(e))
+
+    if args.command == 'local':
+        run_local(args.input_dir, args.store, workers=args.workers, unit_size=args.unit_size,
+                  set_names=tuple(args.sets), labelled=not args.unlabelled, use_vad=args.vad)
+    elif args.command == 'serve':
+        serve(args.input_dir, args.address, authkey, unit_size=args.unit_size,
+              lease_seconds=args.lease_seconds)
+    else:
+        processes = [multiprocessing.Process(target=run_worker,
+                                             args=(args.address, authkey, args.store,
+                                                   tuple(args.sets), not args.unlabelled,
+                                                   args.vad))
+                     for _ in range(args.workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
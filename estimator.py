@@ -0,0 +1,195 @@
+import os
+import threading
+from collections import deque
+
+import numpy as np
+import soundfile as sf
+
+# Pipeline stages timed by predict.analyse_file
+STAGES = ('decode', 'vad', 'extract', 'predict')
+
+# Starting coefficients per stage for [1, minutes, mp3 minutes, megabytes];
+# together they reproduce the old "about 2 s per minute" rule of thumb
+PRIOR = {
+    'decode': [0.5, 0.8, 0.2, 0.0],
+    'vad': [0.0, 0.05, 0.0, 0.0],
+    'extract': [0.2, 0.95, 0.0, 0.0],
+    'predict': [0.05, 0.01, 0.0, 0.0],
+}
+
+# Assumed bitrate, sampling rate and channels when an MP3 header cannot be read
+DEFAULT_MP3_BITRATE = 128_000
+DEFAULT_SAMPLERATE = 44_100
+DEFAULT_CHANNELS = 2
+
+
+def describe_file(filepath):
+    """
+    Cheap description of an upload, read from its header only
+
+    Args:
+        filepath (str): Path to the audio file
+
+    Returns:
+        dict: duration (s), format, bitrate (bit/s), size (bytes), samplerate (Hz)
+            and channels
+    """
+    size = os.path.getsize(filepath)
+    try:
+        info = sf.info(filepath)
+        duration = info.duration
+        audio_format = info.format
+        samplerate = info.samplerate
+        channels = info.channels
+    except Exception:
+        # Header not readable by libsndfile: fall back to a bitrate guess
+        audio_format = os.path.splitext(filepath)[1].lstrip('.').upper()
+        duration = size * 8 / DEFAULT_MP3_BITRATE
+        samplerate = DEFAULT_SAMPLERATE
+        channels = DEFAULT_CHANNELS
+
+    bitrate = size * 8 / duration if duration else 0
+    return {
+        'duration': duration,
+        'format': audio_format,
+        'bitrate': bitrate,
+        'size': size,
+        'samplerate': samplerate,
+        'channels': channels,
+    }
+
+
+def feature_vector(description):
+    """Regression inputs [1, minutes, mp3 minutes, megabytes] for a file description"""
+    minutes = description['duration'] / 60
+    is_mp3 = description['format'] == 'MP3'
+    return np.array([1.0, minutes, minutes if is_mp3 else 0.0, description['size'] / 1e6])
+
+
+class OnlineLinearModel:
+    """
+    Recursive least squares with exponential forgetting
+
+    Each observation updates the coefficients in O(n^2) without keeping
+    past samples; old observations fade out so the model follows changes
+    in hardware or load.
+
+    Forgetting divides P by the factor on every update, so directions the
+    inputs never excite (the mp3 column under WAV-only traffic, or minutes
+    and megabytes moving together) grow without bound until P overflows.
+    Each eigenvalue of P is therefore capped at its initial value, which
+    bounds the unexcited directions without slowing adaptation in the
+    directions the data does cover.
+    """
+
+    def __init__(self, prior, forgetting=0.98, delta=10.0):
+        self.w = np.array(prior, dtype=float)
+        self.P = np.eye(len(self.w)) * delta
+        self.forgetting = forgetting
+        self.delta = delta
+
+    def predict(self, x):
+        return float(x @ self.w)
+
+    def update(self, x, y):
+        if not np.isfinite(y):
+            return
+        Px = self.P @ x
+        gain = Px / (self.forgetting + x @ Px)
+        self.w += gain * (y - x @ self.w)
+        P = (self.P - np.outer(gain, Px)) / self.forgetting
+        # Keep P symmetric and its eigenvalues at most delta
+        P = (P + P.T) / 2
+        if not np.all(np.isfinite(P)):
+            P = np.eye(len(self.w)) * self.delta
+        else:
+            eigenvalues, eigenvectors = np.linalg.eigh(P)
+            if eigenvalues.max() > self.delta:
+                P = (eigenvectors * np.minimum(eigenvalues, self.delta)) @ eigenvectors.T
+        self.P = P
+
+
+class ProcessingTimeEstimator:
+    """
+    Predicts how long an upload will take and learns from finished jobs
+
+    Every pipeline stage has its own online linear model over the file's
+    duration, format and size. The estimate is the sum of the stage
+    predictions plus the time the job will wait behind the jobs already
+    running. Completed jobs feed their measured stage timings back, and
+    the absolute errors of recent estimates are kept for stats().
+    """
+
+    def __init__(self, workers=1, window=200):
+        self.workers = max(1, workers)
+        self.models = {stage: OnlineLinearModel(PRIOR[stage]) for stage in STAGES}
+        self.errors = deque(maxlen=window)
+        self.recent_totals = deque(maxlen=20)
+        self.jobs = 0
+        self._lock = threading.Lock()
+
+    def service_time(self, description):
+        x = feature_vector(description)
+        with self._lock:
+            return sum(max(0.0, model.predict(x)) for model in self.models.values())
+
+    def estimate(self, description, queue_depth=0):
+        """
+        Predicted seconds until the result is ready
+
+        Args:
+            description (dict): Output of describe_file
+            queue_depth (int): Jobs already running or waiting ahead of this one
+
+        Returns:
+            float: Estimated seconds
+        """
+        service = self.service_time(description)
+        with self._lock:
+            mean_job = np.mean(self.recent_totals) if self.recent_totals else service
+        waiting = max(0, queue_depth - self.workers + 1) / self.workers * mean_job
+        return service + waiting
+
+    def observe(self, description, timings, estimated, actual):
+        """
+        Learn from a finished job
+
+        Args:
+            description (dict): Output of describe_file for the job's upload
+            timings (dict): Measured seconds per stage
+            estimated (float): Seconds that were predicted for the job
+            actual (float): Seconds the job really took end to end
+        """
+        x = feature_vector(description)
+        with self._lock:
+            for stage, seconds in timings.items():
+                if stage in self.models:
+                    self.models[stage].update(x, seconds)
+            self.recent_totals.append(sum(timings.values()))
+            self.errors.append((estimated - actual, actual))
+            self.jobs += 1
+
+    def stats(self):
+        """
+        Error statistics of recent estimates and current coefficients
+
+        Returns:
+            dict: jobs seen, mean absolute error, bias, mean absolute
+                percentage error, 90th percentile absolute error, coefficients
+        """
+        with self._lock:
+            errors = np.array(self.errors, dtype=float).reshape(-1, 2)
+            coefficients = {stage: [round(w, 4) for w in model.w]
+                            for stage, model in self.models.items()}
+            jobs = self.jobs
+
+        stats = {'jobs': jobs, 'window': len(errors), 'coefficients': coefficients}
+        if len(errors):
+            signed, actual = errors[:, 0], errors[:, 1]
+            stats.update({
+                'mae_seconds': float(np.mean(np.abs(signed))),
+                'bias_seconds': float(np.mean(signed)),
+                'mape': float(np.mean(np.abs(signed) / np.maximum(actual, 1e-3))),
+                'p90_abs_error_seconds': float(np.percentile(np.abs(signed), 90)),
+            })
+        return stats
@@ -0,0 +1,278 @@
+import time
+import argparse
+import functools
+
+import numpy as np
+import librosa
+import opensmile
+
+import vad
+
+TARGET_SR = 16000
+
+
+@functools.lru_cache(maxsize=None)
+def get_smile(feature_set, feature_level):
+    """
+    Cached opensmile.Smile instance, so the openSMILE config is parsed once per process
+
+    Args:
+        feature_set (opensmile.FeatureSet): openSMILE feature set
+        feature_level (opensmile.FeatureLevel): Functionals or LowLevelDescriptors
+
+    Returns:
+        opensmile.Smile: Extractor
+    """
+    return opensmile.Smile(
+        feature_set=feature_set,
+        feature_level=feature_level,
+        sampling_rate=TARGET_SR
+    )
+
+
+class SignalContext:
+    """
+    One decoded, resampled signal plus a lazily computed shared front-end
+
+    Feature sets read from the same context, so the audio is decoded once
+    and the STFT / mel spectrogram are computed at most once no matter how
+    many librosa-based sets ask for them.
+    """
+
+    def __init__(self, y, sr, n_fft=512, hop_length=160, n_mels=40):
+        self.y = np.ascontiguousarray(y, dtype=np.float32)
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_mels = n_mels
+
+    @classmethod
+    def from_file(cls, audio_file, target_sr=TARGET_SR, use_vad=False, **kwargs):
+        """
+        Decode and resample an audio file straight to target_sr
+
+        Args:
+            audio_file (str): Path to the audio file
+            target_sr (int): Target sampling rate
+            use_vad (bool): Keep only the speech (see vad.keep_speech)
+            **kwargs: Front-end settings passed to SignalContext
+
+        Returns:
+            SignalContext: Context for the decoded signal
+
+        Raises:
+            ValueError: If use_vad is set and no speech was detected
+        """
+        y, sr = librosa.load(audio_file, sr=target_sr)
+        if use_vad:
+            y, _ = vad.keep_speech(y, sr)
+            if len(y) == 0:
+                raise ValueError("No speech detected in the recording")
+        return cls(y, sr, **kwargs)
+
+    @property
+    def duration(self):
+        return len(self.y) / self.sr
+
+    @functools.cached_property
+    def magnitude(self):
+        """Magnitude STFT, shape (1 + n_fft // 2, n_frames)"""
+        return np.abs(librosa.stft(self.y, n_fft=self.n_fft, hop_length=self.hop_length))
+
+    @functools.cached_property
+    def power(self):
+        return self.magnitude ** 2
+
+    @functools.cached_property
+    def mel_db(self):
+        """Log mel spectrogram computed from the shared power spectrum"""
+        mel = librosa.feature.melspectrogram(S=self.power, sr=self.sr, n_mels=self.n_mels)
+        return librosa.power_to_db(mel)
+
+
+def _mean_std(frames):
+    """Summarise (n_descriptors, n_frames) descriptors by their mean and standard deviation"""
+    frames = np.asarray(frames, dtype=np.float32)
+    return np.concatenate([frames.mean(axis=1), frames.std(axis=1)])
+
+
+def _mean_std_names(names):
+    return [f'{n}_mean' for n in names] + [f'{n}_std' for n in names]
+
+
+class OpenSmileFunctionals:
+    """openSMILE functionals (one vector per signal) computed from the shared decoded signal"""
+
+    def __init__(self, feature_set):
+        self.feature_set = feature_set
+
+    @property
+    def smile(self):
+        return get_smile(self.feature_set, opensmile.FeatureLevel.Functionals)
+
+    @property
+    def feature_names(self):
+        return list(self.smile.feature_names)
+
+    def extract(self, context):
+        return self.smile.process_signal(context.y, context.sr).values[0].astype(np.float32)
+
+
+class OpenSmileLLDStats:
+    """openSMILE low-level descriptors summarised by mean and standard deviation"""
+
+    def __init__(self, feature_set):
+        self.feature_set = feature_set
+
+    @property
+    def smile(self):
+        return get_smile(self.feature_set, opensmile.FeatureLevel.LowLevelDescriptors)
+
+    @property
+    def feature_names(self):
+        return _mean_std_names(self.smile.feature_names)
+
+    def extract(self, context):
+        lld = self.smile.process_signal(context.y, context.sr).to_numpy().T
+        return _mean_std(lld)
+
+
+class LibrosaSpectral:
+    """MFCC and spectral shape statistics computed from the shared STFT"""
+
+    DESCRIPTORS = ([f'mfcc{i + 1}' for i in range(13)] +
+                   ['spectral_centroid', 'spectral_bandwidth', 'spectral_rolloff',
+                    'spectral_flatness', 'rms', 'zcr'])
+
+    @property
+    def feature_names(self):
+        return _mean_std_names(self.DESCRIPTORS)
+
+    def extract(self, context):
+        S = context.magnitude
+        sr = context.sr
+        frames = np.vstack([
+            librosa.feature.mfcc(S=context.mel_db, sr=sr, n_mfcc=13),
+            librosa.feature.spectral_centroid(S=S, sr=sr, n_fft=context.n_fft),
+            librosa.feature.spectral_bandwidth(S=S, sr=sr, n_fft=context.n_fft),
+            librosa.feature.spectral_rolloff(S=S, sr=sr, n_fft=context.n_fft),
+            librosa.feature.spectral_flatness(S=S),
+            librosa.feature.rms(S=S, frame_length=context.n_fft),
+            librosa.feature.zero_crossing_rate(context.y, frame_length=context.n_fft,
+                                               hop_length=context.hop_length)[:, :S.shape[1]],
+        ])
+        return _mean_std(frames)
+
+
+FEATURE_SETS = {
+    'egemaps': OpenSmileFunctionals(opensmile.FeatureSet.eGeMAPSv02),
+    'egemaps_lld': OpenSmileLLDStats(opensmile.FeatureSet.eGeMAPSv02),
+    'compare': OpenSmileFunctionals(opensmile.FeatureSet.ComParE_2016),
+    'librosa': LibrosaSpectral(),
+}
+
+
+def feature_names(set_names):
+    """
+    Column names for a combination of feature sets
+
+    Args:
+        set_names (list): Keys of FEATURE_SETS
+
+    Returns:
+        list: Feature names, prefixed with the set name when more than one set is used
+    """
+    if len(set_names) == 1:
+        return FEATURE_SETS[set_names[0]].feature_names
+    return [f'{name}:{feature}' for name in set_names
+            for feature in FEATURE_SETS[name].feature_names]
+
+
+def extract(context, set_names=('egemaps',)):
+    """
+    Compute several feature sets in one pass over a shared SignalContext
+
+    Args:
+        context (SignalContext): Decoded signal
+        set_names (iterable): Keys of FEATURE_SETS
+
+    Returns:
+        numpy.ndarray: Concatenated float32 feature vector
+    """
+    return np.concatenate([FEATURE_SETS[name].extract(context) for name in set_names])
+
+
+def extract_file(audio_file, set_names=('egemaps',), use_vad=vad.USE_VAD):
+    """
+    Decode an audio file once and compute the requested feature sets
+
+    Args:
+        audio_file (str): Path to the audio file
+        set_names (iterable): Keys of FEATURE_SETS
+        use_vad (bool): Drop silence first; must match the serving setting
+
+    Returns:
+        numpy.ndarray: Concatenated float32 feature vector
+    """
+    return extract(SignalContext.from_file(audio_file, use_vad=use_vad), set_names)
+
+
+def benchmark(audio_file, set_names=None, repeats=3):
+    """
+    Measure extraction cost per audio-second for each feature set
+
+    Each set is timed standalone on a fresh context (so it pays for any
+    shared STFT itself), then all sets are timed together to show what
+    sharing the front-end saves. Decode time is reported separately.
+
+    Args:
+        audio_file (str): Audio file to benchmark on
+        set_names (list): Keys of FEATURE_SETS (all sets by default)
+        repeats (int): Runs per measurement; the fastest is kept
+
+    Returns:
+        dict: name -> wall-clock seconds per second of audio
+    """
+    set_names = list(set_names or FEATURE_SETS)
+
+    context = SignalContext.from_file(audio_file)
+    duration = context.duration
+
+    def best_of(fn):
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    # Warm up openSMILE configs and numba-compiled librosa code once
+    extract(SignalContext(context.y, context.sr), set_names)
+
+    results = {'decode': best_of(lambda: SignalContext.from_file(audio_file)) / duration}
+    for name in set_names:
+        results[name] = best_of(lambda: FEATURE_SETS[name].extract(
+            SignalContext(context.y, context.sr))) / duration
+    results['combined'] = best_of(lambda: extract(
+        SignalContext(context.y, context.sr), set_names)) / duration
+
+    print(f"\nExtraction cost for {audio_file} ({duration:.1f} s of audio):")
+    for name, cost in results.items():
+        dims = len(FEATURE_SETS[name].feature_names) if name in FEATURE_SETS else ''
+        print(f"{name:>12}: {cost * 1000:8.2f} ms per audio-second {dims}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark acoustic feature sets")
+    parser.add_argument('audio_file')
+    parser.add_argument('--sets', nargs='+', choices=sorted(FEATURE_SETS),
+                        default=sorted(FEATURE_SETS))
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    benchmark(args.audio_file, args.sets, repeats=args.repeats)
+
+
+if __name__ == "__main__":
+    main()
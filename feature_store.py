@@ -0,0 +1,170 @@
+import os
+import json
+import uuid
+import shutil
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+# Label value for rows that have not been labelled yet
+UNLABELLED = -1
+
+
+class FeatureStore:
+    """
+    On-disk store of feature blocks
+
+    Every block is a directory blocks/<block_id>/ holding X.npy (float32),
+    y.npy (int8, UNLABELLED for unknown rows) and index.npy (row names).
+    Blocks are written to a temporary directory and renamed into place, so
+    a block is either fully visible or absent, and writing the same
+    block_id twice is a no-op. Readers memory-map X so only the rows being
+    used are paged in.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.blocks_dir = os.path.join(root, 'blocks')
+        os.makedirs(self.blocks_dir, exist_ok=True)
+
+    @property
+    def feature_names(self):
+        """list: Column names shared by every block (None for an empty store)"""
+        names_file = os.path.join(self.root, 'feature_names.json')
+        if not os.path.exists(names_file):
+            return None
+        with open(names_file) as f:
+            return json.load(f)
+
+    def _check_feature_names(self, feature_names):
+        existing = self.feature_names
+        if existing is None:
+            tmp_file = os.path.join(self.root, f'.feature_names.{uuid.uuid4().hex}.tmp')
+            with open(tmp_file, 'w') as f:
+                json.dump(list(feature_names), f)
+            os.replace(tmp_file, os.path.join(self.root, 'feature_names.json'))
+        elif list(feature_names) != existing:
+            raise ValueError("Feature names do not match the ones already in the store")
+
+    def has_block(self, block_id):
+        return os.path.isdir(os.path.join(self.blocks_dir, block_id))
+
+    def block_ids(self):
+        """
+        List committed blocks in commit order
+
+        Returns:
+            list: Block ids, oldest first
+        """
+        entries = [e for e in os.scandir(self.blocks_dir)
+                   if e.is_dir() and not e.name.startswith('.')]
+        entries.sort(key=lambda e: (e.stat().st_mtime_ns, e.name))
+        return [e.name for e in entries]
+
+    def put_block(self, X, y=None, index=None, feature_names=None, block_id=None):
+        """
+        Commit a block of feature rows
+
+        Args:
+            X (array-like): Feature matrix (n_rows, n_features)
+            y (array-like): Labels per row (optional, UNLABELLED if omitted)
+            index (list): Row names, e.g. source file names (optional)
+            feature_names (list): Column names (taken from X if it is a DataFrame)
+            block_id (str): Stable id for the block; defaults to a content hash
+
+        Returns:
+            str: The block id (unchanged if the block was already committed)
+        """
+        if isinstance(X, pd.DataFrame):
+            feature_names = feature_names or list(X.columns)
+            index = index if index is not None else [str(i) for i in X.index]
+            X = X.to_numpy()
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        y = (np.full(len(X), UNLABELLED, dtype=np.int8) if y is None
+             else np.asarray(y, dtype=np.int8))
+        index = np.asarray(index if index is not None else
+                           [str(i) for i in range(len(X))], dtype=str)
+        if not (len(X) == len(y) == len(index)):
+            raise ValueError("X, y and index must have the same number of rows")
+
+        if feature_names is not None:
+            self._check_feature_names(feature_names)
+
+        if block_id is None:
+            digest = hashlib.sha256(X.tobytes())
+            digest.update(y.tobytes())
+            block_id = digest.hexdigest()[:16]
+
+        if self.has_block(block_id):
+            return block_id
+
+        tmp_dir = os.path.join(self.blocks_dir, f'.{block_id}.{uuid.uuid4().hex}.tmp')
+        os.makedirs(tmp_dir)
+        try:
+            np.save(os.path.join(tmp_dir, 'X.npy'), X)
+            np.save(os.path.join(tmp_dir, 'y.npy'), y)
+            np.save(os.path.join(tmp_dir, 'index.npy'), index)
+            os.rename(tmp_dir, os.path.join(self.blocks_dir, block_id))
+        except OSError:
+            # Another writer committed the same block first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not self.has_block(block_id):
+                raise
+        return block_id
+
+    def read_block(self, block_id, mmap=True):
+        """
+        Read one block
+
+        Args:
+            block_id (str): Block to read
+            mmap (bool): Memory-map the feature matrix instead of loading it
+
+        Returns:
+            tuple: (X float32 array, y int8 array, index array)
+        """
+        block_dir = os.path.join(self.blocks_dir, block_id)
+        X = np.load(os.path.join(block_dir, 'X.npy'), mmap_mode='r' if mmap else None)
+        y = np.load(os.path.join(block_dir, 'y.npy'))
+        index = np.load(os.path.join(block_dir, 'index.npy'))
+        return X, y, index
+
+    def iter_blocks(self, exclude=(), block_ids=None):
+        """
+        Stream blocks one at a time
+
+        Args:
+            exclude (iterable): Block ids to skip, e.g. ones a model already consumed
+            block_ids (list): Read exactly these blocks in this order instead of
+                listing the store, so repeated passes see the same data even
+                while other writers commit new blocks
+
+        Yields:
+            tuple: (block_id, X, y)
+        """
+        exclude = set(exclude)
+        for block_id in (self.block_ids() if block_ids is None else block_ids):
+            if block_id in exclude:
+                continue
+            X, y, _ = self.read_block(block_id)
+            yield block_id, X, y
+
+    def import_csv(self, csv_file, chunksize=10_000):
+        """
+        Copy a feature CSV into the store without loading it all at once
+
+        Args:
+            csv_file (str): CSV with feature columns and an optional 'label' column
+            chunksize (int): Rows per block
+
+        Returns:
+            list: Ids of the committed blocks
+        """
+        prefix = os.path.splitext(os.path.basename(csv_file))[0]
+        block_ids = []
+        for i, chunk in enumerate(pd.read_csv(csv_file, index_col=0, chunksize=chunksize)):
+            y = chunk.pop('label') if 'label' in chunk.columns else None
+            block_ids.append(self.put_block(chunk, y=y, block_id=f"{prefix}-{i:05d}"))
+        print(f"Imported {len(block_ids)} blocks from {csv_file} into {self.root}")
+        return block_ids
@@ -0,0 +1,257 @@
+"""
+Memory and CPU admission control for analysis jobs
+
+Every job gets a plan before it starts: an estimate of its peak memory
+from the upload's duration, sampling rate and channels, and the settings the
+pipeline should run with. Jobs that fit the per-job and global budgets
+run unchanged. Otherwise the plan is degraded so the job still fits:
+
+- duration_capped: only the first max_duration seconds are decoded
+- fast_resampler: resample with soxr's low-quality mode
+- segments_sampled: only max_segments evenly spaced segments are analysed
+
+The last two are used whenever the process is under pressure: jobs are
+queued, most of the memory budget is reserved, or the process RSS is over
+its soft limit. A job that cannot be admitted waits in a bounded queue
+and is rejected with Overloaded when the queue is full or the wait runs
+out.
+
+Settings (environment):
+    GOVERNOR_MEMORY_MB      memory all running jobs may reserve together (default 1536)
+    GOVERNOR_JOB_MEMORY_MB  peak memory a single job may use (default 512)
+    GOVERNOR_MAX_JOBS       jobs running at once, i.e. the CPU budget (default CPU count)
+    GOVERNOR_MAX_QUEUE      jobs allowed to wait for admission (default 8)
+    GOVERNOR_QUEUE_SECONDS  longest wait for admission (default 120)
+    GOVERNOR_RSS_LIMIT_MB   soft limit on process RSS incl. children (default off)
+"""
+import os
+import time
+import threading
+
+from estimator import DEFAULT_CHANNELS, DEFAULT_SAMPLERATE
+
+TARGET_SR = 16000
+# Bytes per second of audio: float32 decode of every channel at the native
+# rate plus the mono mix / resampler's working copy, and the 16 kHz signal
+# plus its speech copy. Deliberately above what tracemalloc sees (about 5.5
+# bytes per native frame for mono, 12 for stereo), because decoder and soxr
+# buffers are allocated outside Python's tracing
+NATIVE_BYTES_PER_SAMPLE = 4 * 2
+TARGET_BYTES_PER_SAMPLE = 4 * 2
+# Fixed cost of a job: openSMILE buffers, result arrays, interpreter churn
+JOB_OVERHEAD_BYTES = 32 * 1024 * 1024
+
+# Shortest audio worth analysing when the duration has to be capped
+MIN_DURATION = 60.0
+# Segments analysed per job under pressure
+PRESSURE_MAX_SEGMENTS = 5
+# Share of the memory budget above which the process counts as under pressure
+PRESSURE_RESERVED_RATIO = 0.75
+
+FULL_QUALITY_RESAMPLER = 'soxr_hq'
+FAST_RESAMPLER = 'soxr_lq'
+
+MB = 1024 * 1024
+
+
+class Overloaded(RuntimeError):
+    """The job cannot be admitted within the configured budgets"""
+
+
+def bytes_per_second(samplerate, channels=1):
+    return samplerate * channels * NATIVE_BYTES_PER_SAMPLE + TARGET_SR * TARGET_BYTES_PER_SAMPLE
+
+
+def estimate_job_memory(duration, samplerate, channels=1):
+    """
+    Peak memory of analysing an upload
+
+    Args:
+        duration (float): Seconds of audio that will be decoded
+        samplerate (int): Native sampling rate of the upload
+        channels (int): Channels in the upload; all are decoded before the mono mix
+
+    Returns:
+        int: Estimated peak bytes
+    """
+    return int(duration * bytes_per_second(samplerate, channels)) + JOB_OVERHEAD_BYTES
+
+
+def process_rss():
+    """
+    Resident memory of this process and its direct children (pool workers)
+
+    Returns:
+        int: Bytes, or None where /proc is not available
+    """
+    def rss(pid):
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return 0
+
+    pid = os.getpid()
+    if not os.path.exists(f'/proc/{pid}/status'):
+        return None
+    total = rss(pid)
+    try:
+        for tid in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{tid}/children') as f:
+                total += sum(rss(child) for child in f.read().split())
+    except OSError:
+        pass
+    return total
+
+
+class ResourceGovernor:
+    """
+    Admits, queues, degrades or rejects analysis jobs
+
+    Args:
+        memory_budget (int): Bytes all running jobs may reserve together
+        job_memory_limit (int): Bytes a single job may use
+        max_jobs (int): Jobs running at once
+        max_queue (int): Jobs allowed to wait for admission
+        queue_seconds (float): Longest wait for admission
+        rss_limit (int): Soft limit on process RSS in bytes (None disables the check)
+    """
+
+    def __init__(self, memory_budget=None, job_memory_limit=None, max_jobs=None,
+                 max_queue=None, queue_seconds=None, rss_limit=None):
+        env = os.environ.get
+        self.memory_budget = memory_budget or int(env('GOVERNOR_MEMORY_MB', 1536)) * MB
+        self.job_memory_limit = min(job_memory_limit or int(env('GOVERNOR_JOB_MEMORY_MB', 512)) * MB,
+                                    self.memory_budget)
+        self.max_jobs = max_jobs or int(env('GOVERNOR_MAX_JOBS', os.cpu_count() or 1))
+        self.max_queue = max_queue if max_queue is not None else int(env('GOVERNOR_MAX_QUEUE', 8))
+        self.queue_seconds = queue_seconds or float(env('GOVERNOR_QUEUE_SECONDS', 120))
+        self.rss_limit = rss_limit or int(env('GOVERNOR_RSS_LIMIT_MB', 0)) * MB or None
+
+        self.running = 0
+        self.waiting = 0
+        self.reserved = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.degraded = 0
+        self._cond = threading.Condition()
+
+    def under_pressure(self, waiting=None):
+        """Jobs are queued, most memory is reserved, or RSS is over the soft limit"""
+        waiting = self.waiting if waiting is None else waiting
+        if waiting or self.reserved > self.memory_budget * PRESSURE_RESERVED_RATIO:
+            return True
+        if self.rss_limit:
+            rss = process_rss()
+            return rss is not None and rss > self.rss_limit
+        return False
+
+    def plan(self, description, memory_available=None, pressure=False):
+        """
+        Pipeline settings for a job that fit the given memory
+
+        Args:
+            description (dict): Output of estimator.describe_file
+            memory_available (int): Bytes the job may use (defaults to the per-job limit)
+            pressure (bool): Also switch to the fast resampler and segment sampling
+
+        Returns:
+            dict: max_duration (s or None), res_type, max_segments (or None),
+                memory_bytes and the list of degradation reasons
+        """
+        limit = self.job_memory_limit
+        if memory_available is not None:
+            limit = min(limit, memory_available)
+        samplerate = description.get('samplerate') or DEFAULT_SAMPLERATE
+        channels = description.get('channels') or DEFAULT_CHANNELS
+        duration = description['duration']
+
+        plan = {
+            'max_duration': None,
+            'res_type': FULL_QUALITY_RESAMPLER,
+            'max_segments': None,
+            'degraded': [],
+        }
+        if estimate_job_memory(duration, samplerate, channels) > limit:
+            fits = (limit - JOB_OVERHEAD_BYTES) / bytes_per_second(samplerate, channels)
+            plan['max_duration'] = max(MIN_DURATION, float(int(fits)))
+            plan['degraded'].append('duration_capped')
+            duration = min(duration, plan['max_duration'])
+        if pressure:
+            plan['res_type'] = FAST_RESAMPLER
+            plan['max_segments'] = PRESSURE_MAX_SEGMENTS
+            plan['degraded'] += ['fast_resampler', 'segments_sampled']
+        plan['memory_bytes'] = estimate_job_memory(duration, samplerate, channels)
+        return plan
+
+    def admit(self, description):
+        """
+        Wait until the job fits the budgets and reserve its memory
+
+        Blocks the calling thread; call release(plan) when the job is done.
+
+        Args:
+            description (dict): Output of estimator.describe_file
+
+        Returns:
+            dict: The plan the job must run with (see plan())
+
+        Raises:
+            Overloaded: If the queue is full or the job waited too long
+        """
+        with self._cond:
+            if self.running >= self.max_jobs and self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded('Server busy, please try again in a few minutes')
+
+            deadline = time.monotonic() + self.queue_seconds
+            self.waiting += 1
+            try:
+                while True:
+                    if self.running < self.max_jobs:
+                        available = self.memory_budget - self.reserved
+                        # Other queued jobs count as pressure, this one does not
+                        pressure = self.under_pressure(waiting=self.waiting - 1)
+                        plan = self.plan(description, available, pressure)
+                        if plan['memory_bytes'] <= available:
+                            break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise Overloaded('Server busy, please try again in a few minutes')
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+
+            self.running += 1
+            self.reserved += plan['memory_bytes']
+            self.admitted += 1
+            self.degraded += bool(plan['degraded'])
+            return plan
+
+    def release(self, plan):
+        with self._cond:
+            self.running -= 1
+            self.reserved -= plan['memory_bytes']
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            stats = {
+                'running': self.running,
+                'waiting': self.waiting,
+                'reserved_mb': round(self.reserved / MB, 1),
+                'memory_budget_mb': round(self.memory_budget / MB, 1),
+                'job_memory_limit_mb': round(self.job_memory_limit / MB, 1),
+                'max_jobs': self.max_jobs,
+                'admitted': self.admitted,
+                'degraded': self.degraded,
+                'rejected': self.rejected,
+            }
+        rss = process_rss()
+        if rss is not None:
+            stats['rss_mb'] = round(rss / MB, 1)
+        return stats
@@ -0,0 +1,30 @@
+# Loaded automatically by gunicorn from the working directory
+
+
+def post_worker_init(worker):
+    # Runs before the worker accepts connections, so no upload ever reaches a
+    # cold worker. A failure must not escape: gunicorn treats an exception
+    # here as a boot error and halts the whole master. The worker stays up
+    # instead, with readiness 'failed' (already printed by run()), so
+    # /readyz answers 503 and the load balancer keeps traffic away from it.
+    import warmup
+    try:
+        warmup.run()
+    except Exception:
+        pass
+    # Low-rate sampling of pipeline threads when PROFILE_CONTINUOUS_HZ is set
+    import profiling
+    profiling.start_continuous()
+
+
+# Recycle workers regularly so heap fragmentation from large decodes cannot
+# build up until the platform OOM-kills them; the jitter avoids restarting
+# every worker at once
+max_requests = 200
+max_requests_jitter = 50
+# Heartbeat files on tmpfs, so a slow disk cannot stall the worker heartbeat
+worker_tmp_dir = '/dev/shm'
+# A long upload is processed in a background thread; allow time for a clean shutdown
+graceful_timeout = 120
+# The arbiter also applies this to a booting worker, so it must cover the warm-up
+timeout = 120
@@ -0,0 +1,269 @@
+import os
+import json
+import uuid
+import hashlib
+import warnings
+import argparse
+
+import numpy as np
+import pandas as pd
+import librosa
+import opensmile
+from numpy.lib.stride_tricks import sliding_window_view
+
+from feature_sets import get_smile, TARGET_SR
+
+# eGeMAPS low-level descriptors are computed every 10 ms
+FRAME_RATE = 100
+
+# Statistics computed per descriptor, named like the eGeMAPS functionals
+STATISTICS = ['amean', 'stddevNorm', 'percentile20.0', 'percentile50.0',
+              'percentile80.0', 'pctlrange0-2']
+
+# Descriptor whose zeros mark the unvoiced frames
+F0_NAME = 'F0semitoneFrom27.5Hz_sma3nz'
+# Voiced descriptors that are also 0 on voiced frames where they could not
+# be measured (too few consecutive periods); openSMILE leaves those out too
+UNMEASURED_AS_ZERO = ('jitterLocal_sma3nz', 'shimmerLocaldB_sma3nz')
+
+# Windows reduced per batch; bounds the temporary percentile buffer
+WINDOW_BATCH = 256
+
+
+def lld_names():
+    """
+    Names of the eGeMAPS low-level descriptors
+
+    Returns:
+        list: 25 descriptor names
+    """
+    return list(get_smile(opensmile.FeatureSet.eGeMAPSv02,
+                          opensmile.FeatureLevel.LowLevelDescriptors).feature_names)
+
+
+def functional_names():
+    """
+    Column names produced by window_functionals
+
+    Returns:
+        list: One name per (descriptor, statistic)
+    """
+    return [f'{name}_{stat}' for name in lld_names() for stat in STATISTICS]
+
+
+def file_hash(audio_file, chunk_size=1 << 20):
+    """Content hash of an audio file, used as its cache key"""
+    digest = hashlib.sha256()
+    with open(audio_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def extract_lld(audio_file, cache_dir='lld_cache'):
+    """
+    eGeMAPS low-level descriptors for a recording, computed once and cached
+
+    The first call decodes the whole recording at 16 kHz, runs openSMILE at
+    the LowLevelDescriptors level and stores the frames as a float32 .npy
+    file keyed by the file's content hash. Later calls memory-map that file,
+    so re-segmenting a recording never touches openSMILE again.
+
+    Args:
+        audio_file (str): Path to the audio file
+        cache_dir (str): Directory holding cached descriptor frames
+
+    Returns:
+        numpy.ndarray: Read-only (n_frames, 25) float32 array
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    key = file_hash(audio_file)
+    frames_file = os.path.join(cache_dir, f'{key}.npy')
+
+    if not os.path.exists(frames_file):
+        y, sr = librosa.load(audio_file, sr=TARGET_SR)
+        smile = get_smile(opensmile.FeatureSet.eGeMAPSv02,
+                          opensmile.FeatureLevel.LowLevelDescriptors)
+        frames = smile.process_signal(y, sr).to_numpy(dtype=np.float32)
+
+        with open(os.path.join(cache_dir, f'{key}.json'), 'w') as f:
+            json.dump({
+                'source': os.path.abspath(audio_file),
+                'frame_rate': FRAME_RATE,
+                'feature_names': lld_names(),
+                'n_frames': len(frames),
+            }, f, indent=2)
+
+        # Write under a temporary name so a crash never leaves a truncated cache entry
+        tmp_file = os.path.join(cache_dir, f'.{key}.{uuid.uuid4().hex}.npy')
+        np.save(tmp_file, np.ascontiguousarray(frames))
+        os.replace(tmp_file, frames_file)
+
+    return np.load(frames_file, mmap_mode='r')
+
+
+def _reduce_windows(windows, voiced_only, f0_index, zero_unmeasured):
+    """
+    Compute STATISTICS over the last axis of (n_windows, n_lld, n_frames) windows
+
+    Args:
+        windows (numpy.ndarray): Window view over the descriptor frames
+        voiced_only (numpy.ndarray): Boolean mask of descriptors only defined on voiced frames
+        f0_index (int): Position of the F0 descriptor, which is 0 on unvoiced frames
+        zero_unmeasured (numpy.ndarray): Boolean mask of descriptors where 0 also means
+            not measured
+
+    Returns:
+        numpy.ndarray: (n_windows, n_lld * len(STATISTICS)) float32 array
+    """
+    values = np.array(windows, dtype=np.float32)
+    # Descriptors ending in 'nz' are only defined on voiced frames, as in
+    # openSMILE. Voicing comes from F0, not from each descriptor's own value:
+    # formants are non-zero on unvoiced frames too.
+    voiced = values[:, f0_index, :] > 0
+    values[:, voiced_only, :] = np.where(voiced[:, np.newaxis, :],
+                                         values[:, voiced_only, :], np.nan)
+    unmeasured = values[:, zero_unmeasured, :]
+    unmeasured[unmeasured == 0] = np.nan
+    values[:, zero_unmeasured, :] = unmeasured
+
+    # All-unvoiced windows produce empty-slice warnings; they are zeroed below
+    with warnings.catch_warnings(), np.errstate(invalid='ignore', divide='ignore'):
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mean = np.nanmean(values, axis=-1)
+        std = np.nanstd(values, axis=-1)
+        p20, p50, p80 = np.nanpercentile(values, [20, 50, 80], axis=-1)
+        # Signed coefficient of variation, like openSMILE's stddevNorm
+        stddev_norm = np.where(mean != 0, std / mean, 0.0)
+
+    stats = np.stack([mean, stddev_norm, p20, p50, p80, p80 - p20], axis=-1)
+    # Windows without any voiced frame get 0, like openSMILE's functionals
+    stats = np.nan_to_num(stats, nan=0.0)
+    return stats.reshape(len(values), -1).astype(np.float32)
+
+
+def window_functionals(frames, window_seconds=60, hop_seconds=None,
+                       include_partial=True, frame_rate=FRAME_RATE):
+    """
+    Functionals-style statistics for every window of cached descriptor frames
+
+    Windows are strided views over the frame array and every statistic is a
+    NumPy reduction over a whole batch of windows, so trying a new
+    window/hop only costs a few array passes instead of another openSMILE
+    run. The statistics follow the eGeMAPS functionals (mean, normalised
+    standard deviation, 20/50/80th percentiles and their range), but they
+    are not bit-identical to openSMILE's, so a model must be trained on the
+    same kind of features it is served with.
+
+    Args:
+        frames (numpy.ndarray): (n_frames, n_lld) descriptors from extract_lld
+        window_seconds (float): Window length in seconds
+        hop_seconds (float): Hop between window starts (defaults to window_seconds)
+        include_partial (bool): Also return the shorter windows at the end,
+            matching how process_audio_files keeps the final short segment
+        frame_rate (int): Descriptor frames per second
+
+    Returns:
+        numpy.ndarray: (n_windows, n_lld * len(STATISTICS)) float32 array
+    """
+    hop_seconds = hop_seconds or window_seconds
+    window = max(1, int(round(window_seconds * frame_rate)))
+    hop = max(1, int(round(hop_seconds * frame_rate)))
+    n_frames = len(frames)
+    names = lld_names()
+    voiced_only = np.array([name.endswith('nz') for name in names])
+    f0_index = names.index(F0_NAME)
+    zero_unmeasured = np.isin(names, UNMEASURED_AS_ZERO)
+
+    results = []
+    if n_frames >= window:
+        # (n_windows, n_lld, window) view without copying the frames
+        view = sliding_window_view(frames, window, axis=0)[::hop]
+        for start in range(0, len(view), WINDOW_BATCH):
+            results.append(_reduce_windows(view[start:start + WINDOW_BATCH], voiced_only,
+                                           f0_index, zero_unmeasured))
+        next_start = len(view) * hop
+    else:
+        next_start = 0
+
+    if include_partial:
+        for start in range(next_start, n_frames, hop):
+            tail = frames[start:].T[np.newaxis]
+            results.append(_reduce_windows(tail, voiced_only, f0_index, zero_unmeasured))
+
+    if not results:
+        return np.empty((0, len(voiced_only) * len(STATISTICS)), dtype=np.float32)
+    return np.concatenate(results)
+
+
+def segment_features(audio_file, cache_dir='lld_cache', segment_length=60, hop=None):
+    """
+    Per-segment features for one recording, using the LLD cache
+
+    Args:
+        audio_file (str): Path to the audio file
+        cache_dir (str): Directory holding cached descriptor frames
+        segment_length (float): Segment length in seconds
+        hop (float): Hop between segment starts in seconds (defaults to segment_length)
+
+    Returns:
+        pd.DataFrame: One row per segment, indexed like process_audio_files output
+    """
+    features = window_functionals(extract_lld(audio_file, cache_dir), segment_length, hop)
+    index = [f"segment_{i + 1:03d}" for i in range(len(features))]
+    return pd.DataFrame(features, index=index, columns=functional_names())
+
+
+def build_dataset(input_dir, output_file, cache_dir='lld_cache', segment_length=60, hop=None):
+    """
+    Labelled per-segment feature CSV for every recording in a directory
+
+    Args:
+        input_dir (str): Directory containing audio files
+        output_file (str): Path to save the features CSV file
+        cache_dir (str): Directory holding cached descriptor frames
+        segment_length (float): Segment length in seconds
+        hop (float): Hop between segment starts in seconds
+
+    Returns:
+        pd.DataFrame: Features with a 'label' column
+    """
+    from create_train_test_data import get_label
+
+    audio_files = sorted(f for f in os.listdir(input_dir) if f.endswith(('.mp3', '.wav')))
+    frames = []
+    for audio_file in audio_files:
+        try:
+            df = segment_features(os.path.join(input_dir, audio_file), cache_dir,
+                                  segment_length, hop)
+        except Exception as e:
+            print(f"Error processing {audio_file}: {str(e)}")
+            continue
+        df.index = [f"{audio_file}:{i}" for i in df.index]
+        df['label'] = get_label(audio_file)
+        frames.append(df)
+
+    if not frames:
+        raise ValueError("No features were successfully extracted from any files")
+
+    dataset = pd.concat(frames)
+    dataset.to_csv(output_file)
+    print(f"\nFeatures saved to: {output_file} ({len(dataset)} segments)")
+    return dataset
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cached eGeMAPS LLD segmentation")
+    parser.add_argument('input_dir', help="Directory containing audio files")
+    parser.add_argument('--out', default='lld_features.csv')
+    parser.add_argument('--cache-dir', default='lld_cache')
+    parser.add_argument('--segment-length', type=float, default=60)
+    parser.add_argument('--hop', type=float, default=None)
+    args = parser.parse_args()
+
+    build_dataset(args.input_dir, args.out, cache_dir=args.cache_dir,
+                  segment_length=args.segment_length, hop=args.hop)
+
+
+if __name__ == "__main__":
+    main()
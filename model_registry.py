@@ -0,0 +1,312 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+
+import joblib
+from sklearn.pipeline import make_pipeline
+
+LEGACY_VERSION = 'legacy'
+# Settings of the original adhd_classifier.joblib / scaler.joblib pair,
+# trained on eGeMAPS functionals of whole recordings
+LEGACY_METADATA = {'use_vad': False}
+
+
+def check_features(model, version, feature_names, metadata=None, use_vad=None):
+    """
+    Make sure a model takes exactly the features serving produces
+
+    train.py and train_incremental.py can export models trained on other
+    feature sets (ComParE, LLD windows, several sets combined) or on
+    features extracted with or without VAD; scoring the serving features
+    with one of those would silently be wrong.
+
+    Args:
+        model: Fitted estimator
+        version (str): Version name, for the error message
+        feature_names (list): Columns the serving path produces, in order
+            (None skips the column checks)
+        metadata (dict): The version's metadata.json contents (optional)
+        use_vad (bool): Whether serving drops silence before extraction
+            (None skips the check). Models whose metadata does not record
+            use_vad were trained before it was recorded, on whole recordings.
+
+    Raises:
+        ValueError: If the column count, the trained feature names or the
+            VAD setting differ
+    """
+    if feature_names is not None:
+        n_features = getattr(model, 'n_features_in_', None)
+        if n_features is not None and n_features != len(feature_names):
+            raise ValueError(f"Model {version} expects {n_features} features, "
+                             f"serving produces {len(feature_names)}")
+
+        trained_names = (metadata or {}).get('feature_names')
+        if trained_names is None and hasattr(model, 'feature_names_in_'):
+            trained_names = list(model.feature_names_in_)
+        if trained_names is not None and list(trained_names) != list(feature_names):
+            raise ValueError(f"Model {version} was trained on different features "
+                             f"than the ones serving extracts")
+
+    if use_vad is not None:
+        trained_vad = bool((metadata or {}).get('use_vad', False))
+        if trained_vad != bool(use_vad):
+            raise ValueError(f"Model {version} was trained {'with' if trained_vad else 'without'} "
+                             f"VAD, serving runs {'with' if use_vad else 'without'} it "
+                             f"(ADHD_USE_VAD)")
+
+
+def load_version(model_root, version, feature_names=None, use_vad=None):
+    """
+    Load one model version exported by train.py / train_incremental.py
+
+    Args:
+        model_root (str): Directory holding the model versions
+        version (str): Version directory name, or 'legacy' for the original
+            adhd_classifier.joblib / scaler.joblib pair
+        feature_names (list): Serving feature columns to check the model against (optional)
+        use_vad (bool): Serving VAD setting to check the model against (optional)
+
+    Returns:
+        Fitted estimator exposing predict_proba
+
+    Raises:
+        ValueError: If the model does not match feature_names or use_vad
+    """
+    metadata = None
+    if version == LEGACY_VERSION:
+        model = make_pipeline(joblib.load('scaler.joblib'),
+                              joblib.load('adhd_classifier.joblib'))
+        metadata = LEGACY_METADATA
+    else:
+        model = joblib.load(os.path.join(model_root, version, 'model.joblib'))
+        metadata_file = os.path.join(model_root, version, 'metadata.json')
+        if os.path.exists(metadata_file):
+            with open(metadata_file) as f:
+                metadata = json.load(f)
+
+    if feature_names is not None or use_vad is not None:
+        check_features(model, version, feature_names, metadata, use_vad)
+    return model
+
+
+def read_config(model_root, config_file=None):
+    """
+    Read the routing configuration
+
+    The config is a JSON file (model_root/registry.json by default):
+
+        {"routes": {"<version>": 0.9, "<other version>": 0.1},
+         "shadow": ["<candidate version>"]}
+
+    Without a config file all traffic goes to the LATEST version (or the
+    legacy model if nothing has been exported yet) and nothing is shadowed.
+
+    Args:
+        model_root (str): Directory holding the model versions
+        config_file (str): Explicit config path (optional)
+
+    Returns:
+        tuple: (routes dict of version -> weight, list of shadow versions)
+    """
+    config_file = config_file or os.path.join(model_root, 'registry.json')
+    if os.path.exists(config_file):
+        with open(config_file) as f:
+            config = json.load(f)
+        routes = {str(v): float(w) for v, w in config.get('routes', {}).items() if float(w) > 0}
+        shadow = [str(v) for v in config.get('shadow', [])]
+        if routes:
+            return routes, shadow
+
+    latest_file = os.path.join(model_root, 'LATEST')
+    if os.path.exists(latest_file):
+        with open(latest_file) as f:
+            return {f.read().strip(): 1.0}, []
+    return {LEGACY_VERSION: 1.0}, []
+
+
+class ShadowStats:
+    """
+    Running divergence of each shadow model from the primary
+
+    Fed with the comparison records produced by ModelRegistry.score, either
+    inside the registry's own process or, when scoring happens in a process
+    pool, in the process serving /models.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def add(self, record):
+        with self._lock:
+            stats = self._stats.setdefault(record['shadow'], {
+                'requests': 0, 'abs_divergence_sum': 0.0, 'flips': 0, 'shadow_us_sum': 0.0,
+            })
+            stats['requests'] += 1
+            stats['abs_divergence_sum'] += abs(record['divergence'])
+            stats['flips'] += int(record['decision_flipped'])
+            stats['shadow_us_sum'] += record['shadow_us']
+
+    def summary(self):
+        """
+        Aggregates per shadow version
+
+        Returns:
+            dict: version -> {requests, mean_abs_divergence, flip_rate, mean_shadow_us}
+        """
+        with self._lock:
+            return {
+                version: {
+                    'requests': s['requests'],
+                    'mean_abs_divergence': s['abs_divergence_sum'] / s['requests'],
+                    'flip_rate': s['flips'] / s['requests'],
+                    'mean_shadow_us': s['shadow_us_sum'] / s['requests'],
+                }
+                for version, s in self._stats.items()
+            }
+
+
+class ModelRegistry:
+    """
+    Holds several model versions in memory and routes scoring between them
+
+    A configurable fraction of requests is routed to each version in
+    'routes'. Every version listed in 'shadow' additionally scores the same
+    feature matrix on every request; its output is printed as a JSON line
+    and aggregated for /models but never shown to the user, so candidates
+    can be compared on live traffic without repeating feature extraction.
+    """
+
+    def __init__(self, model_root='models', config_file=None, feature_names=None, use_vad=None):
+        self.model_root = model_root
+        self.config_file = config_file
+        # Columns the serving path produces; versions trained on others are rejected
+        self.feature_names = feature_names
+        # Serving VAD setting; versions trained with the other one are rejected
+        self.use_vad = use_vad
+        self._shadow_stats = ShadowStats()
+        self.reload()
+
+    def reload(self):
+        """
+        Re-read the config and load any versions not already in memory
+
+        Versions that do not match the serving features or VAD setting are
+        left out of routing and shadowing.
+
+        Raises:
+            ValueError: If none of the routed versions can be served
+        """
+        routes, shadow = read_config(self.model_root, self.config_file)
+        models = dict(getattr(self, 'models', {}))
+        for version in set(routes) | set(shadow):
+            if version not in models:
+                try:
+                    models[version] = load_version(self.model_root, version, self.feature_names,
+                                                   self.use_vad)
+                except ValueError as e:
+                    print(f"Rejected model version {version}: {str(e)}")
+                    continue
+                print(f"Loaded model version: {version}")
+
+        routes = {v: w for v, w in routes.items() if v in models}
+        shadow = [v for v in shadow if v in models]
+        if not routes:
+            raise ValueError("No routed model version matches the serving features")
+
+        # Swap everything at once so concurrent requests see a consistent view
+        total = sum(routes.values())
+        self.models = {v: models[v] for v in set(routes) | set(shadow)}
+        self.routes = [(v, w / total) for v, w in sorted(routes.items())]
+        self.shadow = shadow
+
+    def choose(self, route_key=None):
+        """
+        Pick the primary version for a request
+
+        Args:
+            route_key (str): Sticky key such as the upload's content hash; the
+                same key always lands on the same version. Random if omitted.
+
+        Returns:
+            str: Model version
+        """
+        if route_key is None:
+            point = random.random()
+        else:
+            digest = hashlib.sha256(str(route_key).encode()).digest()
+            point = int.from_bytes(digest[:8], 'big') / 2 ** 64
+
+        cumulative = 0.0
+        for version, weight in self.routes:
+            cumulative += weight
+            if point < cumulative:
+                return version
+        return self.routes[-1][0]
+
+    def score(self, features, route_key=None):
+        """
+        Score features with the routed model and all shadow models
+
+        Args:
+            features (array-like): Feature matrix, one row per segment
+            route_key (str): Sticky routing key (optional)
+
+        Returns:
+            tuple: (version, ADHD probability per row, list of shadow comparison records)
+        """
+        version = self.choose(route_key)
+        probabilities = self.models[version].predict_proba(features)[:, 1]
+        primary_mean = float(probabilities.mean())
+
+        records = []
+        for shadow_version in self.shadow:
+            if shadow_version == version:
+                continue
+            start = time.perf_counter()
+            try:
+                shadow_mean = float(self.models[shadow_version].predict_proba(features)[:, 1].mean())
+            except Exception as e:
+                print(f"Shadow model {shadow_version} failed: {str(e)}")
+                continue
+            elapsed_us = (time.perf_counter() - start) * 1e6
+            records.append(self._record_shadow(version, shadow_version, primary_mean,
+                                               shadow_mean, elapsed_us))
+
+        return version, probabilities, records
+
+    def _record_shadow(self, version, shadow_version, primary_mean, shadow_mean, elapsed_us):
+        divergence = shadow_mean - primary_mean
+        record = {
+            'event': 'shadow_score',
+            'primary': version,
+            'shadow': shadow_version,
+            'primary_probability': round(primary_mean, 6),
+            'shadow_probability': round(shadow_mean, 6),
+            'divergence': round(divergence, 6),
+            'decision_flipped': (primary_mean >= 0.5) != (shadow_mean >= 0.5),
+            'shadow_us': round(elapsed_us, 1),
+        }
+        print(json.dumps(record), flush=True)
+        self._shadow_stats.add(record)
+        return record
+
+    def shadow_stats(self):
+        """
+        Aggregate divergence of each shadow model since start-up
+
+        Returns:
+            dict: version -> {requests, mean_abs_divergence, flip_rate, mean_shadow_us}
+        """
+        return self._shadow_stats.summary()
+
+    def describe(self):
+        """Routing weights, shadow versions and loaded versions, for /models"""
+        return {
+            'routes': dict(self.routes),
+            'shadow': list(self.shadow),
+            'loaded': sorted(self.models),
+        }
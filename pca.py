@@ -3,6 +3,8 @@ import numpy as np
 import pandas as pd
 from sklearn.decomposition import PCA
 from sklearn.preprocessing import StandardScaler
+import matplotlib
+matplotlib.use('Agg')  # Headless backend: figures are only saved, never shown
 import matplotlib.pyplot as plt
 
 # Step 2: Load and Prepare Your Data
@@ -45,7 +47,7 @@ plt.title('Explained Variance by Principal Components (eGeMAPs Features)')
 plt.legend(loc='best')
 plt.grid()
 plt.savefig('pca_test_variance_plot.png')
-plt.show()
+plt.close()
 
 # Step 5: Print Component Information
 print("\nPCA Component Information:")
@@ -53,9 +55,9 @@ for i, (ratio, cum_ratio) in enumerate(zip(explained_variance_ratio, cumulative_
     print(f"PC{i+1}: {ratio*100:.2f}% (Cumulative: {cum_ratio*100:.2f}%)")
 
 # Step 6: Retain Selected Components
-# Re-fit PCA with the selected number of components
-pca_reduced = PCA(n_components=32)
-X_pca_reduced = pca_reduced.fit_transform(X_scaled)
+# The full fit already holds every component, so keep the leading ones
+# instead of re-fitting PCA(n_components=32) on the same data
+X_pca_reduced = X_pca[:, :32]
 
 # Create DataFrame with reduced PCA components and labels
 pca_df = pd.DataFrame(
@@ -79,4 +81,4 @@ plt.ylabel('Second Principal Component')
 plt.title('PCA Components 1 vs 2 (Colored by ADHD Label)')
 plt.colorbar(label='ADHD Label')
 plt.savefig('pca_test_components_plot.png')
-plt.show()
\ No newline at end of file
+plt.close()
\ No newline at end of file
@@ -1,11 +1,44 @@
-import joblib
-from create_predict_data import process_audio_files
-def predict_adhd(features_df):
+import os
+import time
+import warnings
+import functools
+from profiling import stage
+import opensmile
+import vad
+from model_registry import ModelRegistry
+from feature_sets import get_smile
+from create_predict_data import process_audio_files, load_signal, extract_features
+
+MODEL_ROOT = os.environ.get('ADHD_MODEL_DIR', 'models')
+
+# The serving path scores plain float32 arrays whose columns are always in
+# openSMILE's eGeMAPS order, so sklearn's feature-name check has nothing to add
+warnings.filterwarnings('ignore', message='X does not have valid feature names')
+
+
+@functools.lru_cache(maxsize=None)
+def get_registry():
+    """
+    Model registry shared by every request in this worker
+
+    Returns:
+        ModelRegistry: Registry loaded from MODEL_ROOT
     """
-    Predict ADHD from features DataFrame
+    # extract_features produces eGeMAPS functionals in this column order, with
+    # or without VAD according to vad.USE_VAD
+    feature_names = get_smile(opensmile.FeatureSet.eGeMAPSv02,
+                              opensmile.FeatureLevel.Functionals).feature_names
+    return ModelRegistry(MODEL_ROOT, config_file=os.environ.get('ADHD_MODEL_REGISTRY'),
+                         feature_names=feature_names, use_vad=vad.USE_VAD)
+
+
+def predict_adhd(features_df, route_key=None):
+    """
+    Predict ADHD from per-segment features
     
     Args:
-        features_df (pd.DataFrame): DataFrame containing features
+        features_df (array-like): (n_segments, 88) float32 array or DataFrame of features
+        route_key (str): Sticky key for A/B routing, e.g. the upload's hash (optional)
         
     Returns:
         dict: Dictionary containing prediction results
@@ -17,19 +50,11 @@ def predict_adhd(features_df):
             }
     """
     try:
-        # Load the trained model and scaler
-        model = joblib.load('adhd_classifier.joblib')
-        scaler = joblib.load('scaler.joblib')
-        
-        # Scale the features
-        X_scaled = scaler.transform(features_df)
-        
-        # Make predictions
-        predictions = model.predict(X_scaled)
-        probabilities = model.predict_proba(X_scaled)
+        # Score with the routed model; shadow models reuse the same features
+        version, probabilities, shadow = get_registry().score(features_df, route_key=route_key)
         print(probabilities)
         # Calculate average probability for ADHD
-        avg_probability = probabilities[:, 1].mean()
+        avg_probability = probabilities.mean()
         
         # Determine final prediction
         final_prediction = 1 if avg_probability >= 0.5 else 0
@@ -40,6 +65,9 @@ def predict_adhd(features_df):
             'prediction': f"prediction: {'ADHD' if final_prediction == 1 else 'Non-ADHD'}",
             'probability': f"Probability of ADHD: {avg_probability:.2%}",
             'percentage': float(avg_probability * 100),
+            'model_version': version,
+            # Shadow comparisons, for the server's /models stats only
+            'shadow': shadow,
         }
         
         return result
@@ -52,6 +80,61 @@ def predict_adhd(features_df):
             'message': f'Error processing features: {str(e)}'
         }
 
+def analyse_file(filepath, route_key=None, plan=None):
+    """
+    Run the whole pipeline on one uploaded file
+    
+    Decoding, VAD, segmentation and extraction all happen in memory on one
+    float32 buffer (see create_predict_data.extract_features), so
+    concurrent jobs in threads or worker processes share no files.
+    
+    Args:
+        filepath (str): Path to the uploaded audio file
+        route_key (str): Sticky key for A/B routing (optional)
+        plan (dict): Settings from governor.ResourceGovernor.admit (optional);
+            may cap the decoded duration, pick a faster resampler or sample segments
+        
+    Returns:
+        dict: Prediction result from predict_adhd plus the voice activity report,
+            the seconds spent in each pipeline stage ('timings') and 'degraded';
+            when degraded is True, 'degradation' lists what was cut
+    """
+    plan = plan or {}
+    start = time.perf_counter()
+    with stage('decode'):
+        y, sr = load_signal(filepath, duration=plan.get('max_duration'),
+                            res_type=plan.get('res_type', 'soxr_hq'))
+    timings = {'decode': time.perf_counter() - start}
+    
+    features, vad_report, extract_timings, segments = extract_features(
+        y, sr, max_segments=plan.get('max_segments'))
+    timings.update(extract_timings)
+    
+    start = time.perf_counter()
+    with stage('predict'):
+        result = predict_adhd(features, route_key=route_key)
+    timings['predict'] = time.perf_counter() - start
+    
+    # Duration and segment cuts are reported only when they removed audio
+    reasons = []
+    if plan.get('max_duration') and len(y) >= int(plan['max_duration'] * sr):
+        reasons.append('duration_capped')
+    if plan.get('res_type', 'soxr_hq') != 'soxr_hq':
+        reasons.append('fast_resampler')
+    if segments['analysed'] < segments['total']:
+        reasons.append('segments_sampled')
+    
+    result['vad'] = vad_report
+    result['timings'] = timings
+    result['degraded'] = bool(reasons)
+    if reasons:
+        result['degradation'] = {
+            'reasons': reasons,
+            'analysed_seconds': round(len(y) / sr, 2),
+            'segments': segments,
+        }
+    return result
+
 def main():
     # Example usage
     # Process audio file
@@ -0,0 +1,428 @@
+"""
+Sampling profiler, allocation reports and flame graphs for the serving path
+
+Per request (opt-in, admin only): set PROFILE_ADMIN_TOKEN on the server and
+send the same token in an 'X-Profile' header or a 'profile' query parameter.
+That upload runs on its own, outside request coalescing, under a sampling
+profiler and tracemalloc. The reports are written to
+PROFILE_DIR/<request_id>/:
+
+    flame.svg        flame graph, one root per pipeline stage
+    stacks.folded    folded stacks (flamegraph.pl / speedscope input)
+    allocations.txt  top allocation sites and peak traced memory
+    summary.json     samples per stage and per library (librosa, opensmile, sklearn, ...)
+
+tracemalloc cannot tell threads apart. The allocation sites are limited to
+call stacks that pass through the profiled function's module, which leaves
+out the server's own threads, but the peak covers the whole process. Under
+asgi.py each pool process runs one job at a time, so both are exact. Under
+app.py, other uploads being analysed in the same worker at the same time
+run through the same code and are included. allocations.txt and
+summary.json report how many such threads were seen during the run.
+
+Continuous profiling: PROFILE_CONTINUOUS_HZ (e.g. 10) samples every thread
+that is inside a pipeline stage at that rate and writes a folded stack file
+and flame graph per process every PROFILE_FLUSH_SECONDS to PROFILE_DIR/continuous/.
+"""
+import os
+import sys
+import hmac
+import html
+import json
+import time
+import uuid
+import zlib
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+# Libraries whose time is reported separately in summaries
+LIBRARIES = ('librosa', 'opensmile', 'sklearn', 'numpy', 'scipy', 'soundfile',
+             'audioread', 'soxr', 'joblib', 'pandas')
+
+# Pipeline stage currently running in each thread, keyed by thread id
+_stages = {}
+# tracemalloc is process-wide, so profiled requests run one at a time
+_profile_lock = threading.Lock()
+# Frames kept per allocation, deep enough to reach the profiled function
+# from inside librosa/numpy/sklearn internals
+TRACEMALLOC_FRAMES = 64
+
+
+@contextmanager
+def stage(name):
+    """Label the calling thread's samples with a pipeline stage"""
+    thread_id = threading.get_ident()
+    previous = _stages.get(thread_id)
+    _stages[thread_id] = name
+    try:
+        yield
+    finally:
+        if previous is None:
+            _stages.pop(thread_id, None)
+        else:
+            _stages[thread_id] = previous
+
+
+def requested(headers, args):
+    """
+    Whether a request asked for profiling with the admin token
+
+    Args:
+        headers: Request headers mapping
+        args: Query parameters mapping
+
+    Returns:
+        bool: True only if PROFILE_ADMIN_TOKEN is set and matches
+    """
+    token = os.environ.get('PROFILE_ADMIN_TOKEN')
+    if not token:
+        return False
+    supplied = headers.get('X-Profile') or args.get('profile') or ''
+    return hmac.compare_digest(supplied.encode(), token.encode())
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+
+def _library(filename):
+    """Library a source file belongs to, or None for application code"""
+    parts = filename.replace('\\', '/').split('/')
+    for library in LIBRARIES:
+        if library in parts:
+            return library
+    return None
+
+
+def _frame_label(code):
+    library = _library(code.co_filename)
+    return f"{code.co_name} ({library or os.path.basename(code.co_filename)})"
+
+
+def _fold(frame, stage_name):
+    """Folded stack for one frame: '[stage];outer;...;inner', plus the innermost library"""
+    labels = []
+    library = None
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        if library is None:
+            library = _library(frame.f_code.co_filename)
+        frame = frame.f_back
+    labels.append(f"[{stage_name}]")
+    return ';'.join(reversed(labels)), library
+
+
+class SamplingProfiler:
+    """
+    Background thread that samples Python stacks with sys._current_frames()
+
+    Args:
+        thread_ids (set): Threads to sample; None samples every thread inside a stage()
+        interval (float): Seconds between samples
+    """
+
+    def __init__(self, thread_ids=None, interval=PROFILE_INTERVAL):
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.stacks = Counter()
+        # (stage, library) -> samples; library is None for application code
+        self.attribution = Counter()
+        self.samples = 0
+        # Most threads seen inside a stage at once besides the sampled ones
+        self.concurrent = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        frames = sys._current_frames()
+        with self._lock:
+            if self.thread_ids is not None:
+                self.concurrent = max(self.concurrent, len(_stages.keys() - self.thread_ids))
+            for thread_id, frame in frames.items():
+                if self.thread_ids is not None:
+                    if thread_id not in self.thread_ids:
+                        continue
+                elif thread_id not in _stages:
+                    continue
+                stage_name = _stages.get(thread_id, 'other')
+                stack, library = _fold(frame, stage_name)
+                self.stacks[stack] += 1
+                self.attribution[stage_name, library] += 1
+                self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def drain(self):
+        """Take the collected samples and reset the counters"""
+        with self._lock:
+            stacks, attribution, samples = self.stacks, self.attribution, self.samples
+            self.stacks, self.attribution, self.samples = Counter(), Counter(), 0
+        return stacks, attribution, samples
+
+    def summary(self, attribution=None, wall_seconds=None):
+        """
+        Samples and estimated seconds per stage, split by library
+
+        Native code that holds the GIL delays the sampler, so when the wall
+        time of the profiled run is known the seconds are its sample share
+        of that wall time rather than samples times the interval.
+
+        Args:
+            attribution (Counter): (stage, library) counts; defaults to this profiler's
+            wall_seconds (float): Wall time covered by the samples (optional)
+
+        Returns:
+            dict: {stage: {'samples', 'seconds', 'libraries': {library: share}}}
+        """
+        attribution = self.attribution if attribution is None else attribution
+        stages = {}
+        for (stage_name, library), count in attribution.items():
+            entry = stages.setdefault(stage_name, {'samples': 0, 'libraries': Counter()})
+            entry['samples'] += count
+            entry['libraries'][library or 'application'] += count
+        total = sum(entry['samples'] for entry in stages.values()) or 1
+        return {
+            stage_name: {
+                'samples': entry['samples'],
+                'seconds': round(entry['samples'] / total * wall_seconds if wall_seconds
+                                 else entry['samples'] * self.interval, 3),
+                'libraries': {library: round(count / entry['samples'], 4)
+                              for library, count in entry['libraries'].most_common()},
+            }
+            for stage_name, entry in stages.items()
+        }
+
+
+def write_folded(stacks, path):
+    with open(path, 'w') as f:
+        for stack, count in sorted(stacks.items()):
+            f.write(f"{stack} {count}\n")
+
+
+def _color(label):
+    """Stable warm colour per library, so the same code has the same colour everywhere"""
+    library = label[label.rfind('(') + 1:-1] if label.endswith(')') else label
+    hue = zlib.crc32(library.encode()) % 60
+    return f"hsl({hue}, 80%, {55 + zlib.crc32(label.encode()) % 15}%)"
+
+
+def write_flame_graph(stacks, path, title='Flame graph', width=1200, row_height=17):
+    """
+    Render folded stacks as a standalone SVG flame graph
+
+    Args:
+        stacks (Counter): Folded stack -> sample count
+        path (str): Destination .svg path
+        title (str): Heading drawn above the graph
+        width (int): Image width in pixels
+        row_height (int): Height of one stack level in pixels
+    """
+    # Merge stacks into a tree of {label: [count, children]}
+    root = [0, {}]
+    for stack, count in stacks.items():
+        root[0] += count
+        node = root
+        for label in stack.split(';'):
+            node = node[1].setdefault(label, [0, {}])
+            node[0] += count
+
+    total = max(root[0], 1)
+    rects = []
+    depth_max = 0
+
+    def layout(children, x, depth):
+        nonlocal depth_max
+        for label, (count, grandchildren) in sorted(children.items()):
+            w = count / total * width
+            if w >= 0.5:
+                depth_max = max(depth_max, depth)
+                rects.append((x, depth, w, label, count))
+                layout(grandchildren, x, depth + 1)
+            x += w
+
+    layout(root[1], 0.0, 0)
+    top = 40
+    height = top + (depth_max + 1) * row_height + 10
+
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+             f'font-family="monospace" font-size="11">',
+             f'<text x="10" y="24" font-size="16">{html.escape(title)} ({root[0]} samples)</text>']
+    for x, depth, w, label, count in rects:
+        # Root stages at the bottom, callees stacked above them
+        y = height - 10 - (depth + 1) * row_height
+        text = html.escape(label)
+        parts.append(
+            f'<g><title>{text}: {count} samples ({count / total:.1%})</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_height - 1}" '
+            f'fill="{_color(label)}" rx="2"/>')
+        if w > 40:
+            parts.append(f'<text x="{x + 3:.1f}" y="{y + row_height - 5}">'
+                         f'{html.escape(label[:int(w / 7)])}</text>')
+        parts.append('</g>')
+    parts.append('</svg>')
+    with open(path, 'w') as f:
+        f.write('\n'.join(parts))
+
+
+def write_allocations(snapshot, peak, path, limit=30, code_file=None, concurrent=0):
+    """
+    Top allocation sites of a tracemalloc snapshot, also grouped by library
+
+    Args:
+        snapshot (tracemalloc.Snapshot): Snapshot taken at the end of the run
+        peak (int): Peak traced bytes during the run (whole process)
+        path (str): Destination text file
+        limit (int): Allocation sites listed
+        code_file (str): Only count allocations whose call stack passes through this file
+        concurrent (int): Other pipeline threads seen while tracing
+    """
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    if code_file:
+        filters.append(tracemalloc.Filter(True, code_file, all_frames=True))
+    snapshot = snapshot.filter_traces(filters)
+    by_line = snapshot.statistics('lineno')
+    by_library = Counter()
+    for stat in snapshot.statistics('filename'):
+        by_library[_library(stat.traceback[0].filename) or 'application'] += stat.size
+
+    with open(path, 'w') as f:
+        f.write(f"Peak traced memory: {peak / 1e6:.1f} MB (whole process, every thread)\n")
+        f.write(f"Still allocated at end: {sum(s.size for s in by_line) / 1e6:.1f} MB\n")
+        if code_file:
+            f.write(f"Allocation sites: call stacks through {code_file} only\n")
+        f.write(f"Other pipeline threads during the run: {concurrent}")
+        if concurrent:
+            f.write(" (their allocations through the same code and the peak include them)")
+        f.write("\n\n")
+        f.write("By library:\n")
+        for library, size in by_library.most_common():
+            f.write(f"  {library:<12} {size / 1e6:10.2f} MB\n")
+        f.write(f"\nTop {limit} allocation sites:\n")
+        for stat in by_line[:limit]:
+            frame = stat.traceback[0]
+            f.write(f"  {stat.size / 1e6:10.2f} MB {stat.count:8d} blocks  "
+                    f"{frame.filename}:{frame.lineno}\n")
+
+
+def profile_call(request_id, fn, *args, **kwargs):
+    """
+    Run fn in the calling thread under the sampling profiler and tracemalloc
+
+    Allocations are reported for call stacks through fn's module only; the
+    peak is process-wide (see the module docstring).
+
+    Args:
+        request_id (str): Tag for the output directory PROFILE_DIR/<request_id>
+        fn (callable): Function to profile
+        *args, **kwargs: Passed to fn
+
+    Returns:
+        tuple: (fn's return value, summary dict that was written to summary.json)
+    """
+    out_dir = os.path.join(PROFILE_DIR, request_id)
+    os.makedirs(out_dir, exist_ok=True)
+
+    with _profile_lock:
+        profiler = SamplingProfiler(thread_ids={threading.get_ident()})
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            profiler.stop()
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+
+    summary = {
+        'request_id': request_id,
+        'wall_seconds': round(elapsed, 3),
+        'samples': profiler.samples,
+        'interval_seconds': profiler.interval,
+        'peak_traced_mb': round(peak / 1e6, 1),
+        'concurrent_pipeline_threads': profiler.concurrent,
+        'stages': profiler.summary(wall_seconds=elapsed),
+        'dir': out_dir,
+    }
+    write_folded(profiler.stacks, os.path.join(out_dir, 'stacks.folded'))
+    write_flame_graph(profiler.stacks, os.path.join(out_dir, 'flame.svg'),
+                      title=f'Request {request_id}')
+    write_allocations(snapshot, peak, os.path.join(out_dir, 'allocations.txt'),
+                      code_file=fn.__code__.co_filename, concurrent=profiler.concurrent)
+    with open(os.path.join(out_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    return result, summary
+
+
+def analyse_file_profiled(filepath, route_key=None, request_id=None, plan=None):
+    """
+    predict.analyse_file under profile_call; usable as a process-pool task
+
+    Returns:
+        dict: The prediction result with the profile summary under 'profile'
+    """
+    import predict
+
+    request_id = request_id or new_request_id()
+    result, summary = profile_call(request_id, predict.analyse_file, filepath, route_key, plan)
+    result['profile'] = summary
+    return result
+
+
+_continuous = None
+
+
+def start_continuous():
+    """
+    Start low-rate continuous profiling if PROFILE_CONTINUOUS_HZ is set
+
+    Only threads inside a pipeline stage are sampled. Safe to call more
+    than once and from process-pool initializers.
+
+    Returns:
+        SamplingProfiler: The running profiler, or None when disabled
+    """
+    global _continuous
+    hz = float(os.environ.get('PROFILE_CONTINUOUS_HZ', 0))
+    if hz <= 0 or _continuous is not None:
+        return _continuous
+    flush_seconds = float(os.environ.get('PROFILE_FLUSH_SECONDS', 300))
+    out_dir = os.path.join(PROFILE_DIR, 'continuous')
+    os.makedirs(out_dir, exist_ok=True)
+    _continuous = SamplingProfiler(interval=1.0 / hz).start()
+
+    def flush():
+        while True:
+            time.sleep(flush_seconds)
+            stacks, attribution, samples = _continuous.drain()
+            if not samples:
+                continue
+            name = f"{os.getpid()}-{time.strftime('%Y%m%dT%H%M%S')}"
+            write_folded(stacks, os.path.join(out_dir, f'{name}.folded'))
+            write_flame_graph(stacks, os.path.join(out_dir, f'{name}.svg'),
+                              title=f'Continuous profile {name}')
+            with open(os.path.join(out_dir, f'{name}.json'), 'w') as f:
+                json.dump(_continuous.summary(attribution), f, indent=2)
+
+    threading.Thread(target=flush, name='profile-flush', daemon=True).start()
+    return _continuous
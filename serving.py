@@ -0,0 +1,31 @@
+"""
+Upload settings and server-sent event messages shared by app.py and asgi.py
+
+Importing this module has no side effects, so either entry point can use
+it without building the other one's app or creating its upload folder.
+"""
+import os
+import json
+import tempfile
+
+# Use system temp directory for uploads in production
+if os.environ.get('RAILWAY_ENVIRONMENT'):
+    UPLOAD_FOLDER = tempfile.gettempdir()
+else:
+    UPLOAD_FOLDER = 'uploads'
+
+MAX_CONTENT_LENGTH = 1000 * 1024 * 1024  # 100MB max file size
+MAX_CONTENT_PATH = 255  # Maximum length of file path
+ALLOWED_EXTENSIONS = {'mp3', 'wav'}
+
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def send_estimate_time(estimate_time):
+    return f"data: {json.dumps({'type': 'estimate', 'estimate_time': estimate_time})}\n\n"
+
+
+def send_result(result, success=False):
+    return f"data: {json.dumps({'type': 'result','success':success, 'result': result})}\n\n"
@@ -0,0 +1,77 @@
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pytest
+import soundfile as sf
+from starlette.testclient import TestClient
+
+import asgi
+import warmup
+
+
+def events(response):
+    return [json.loads(line[len('data: '):]) for line in response.text.splitlines()
+            if line.startswith('data: ')]
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(asgi, 'UPLOAD_FOLDER', str(tmp_path))
+    # Without the context manager the lifespan (and its process pool) is not started
+    return TestClient(asgi.app)
+
+
+def test_importing_asgi_does_not_build_the_flask_app():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    check = "import sys, asgi; print('app' in sys.modules)"
+    output = subprocess.run([sys.executable, '-c', check], cwd=root, check=True,
+                            capture_output=True, text=True).stdout
+    assert output.strip() == 'False'
+
+
+def test_malformed_content_length_is_reported_as_an_event(client):
+    response = client.post('/upload_file', content=b'',
+                           headers={'content-length': 'not-a-number'})
+    assert response.headers['content-type'].startswith('text/event-stream')
+    [event] = events(response)
+    assert event['result'] == {'success': False, 'message': 'Invalid Content-Length header'}
+
+
+def broken_pool():
+    pool = ProcessPoolExecutor(max_workers=1)
+    with pytest.raises(Exception):
+        pool.submit(os._exit, 1).result()
+    return pool
+
+
+def test_broken_pool_is_replaced_and_warmed_again(client, tmp_path, monkeypatch):
+    replacement = ThreadPoolExecutor(max_workers=1)
+    warmed = []
+
+    async def warm_pool():
+        warmed.append(asgi.pool)
+
+    monkeypatch.setattr(asgi, 'new_pool', lambda: replacement)
+    monkeypatch.setattr(asgi, 'warm_pool', warm_pool)
+    monkeypatch.setattr(asgi, 'pool', broken_pool())
+    monkeypatch.setattr(asgi, 'warming', None)
+    warmup.readiness.set('ready')
+
+    clip = tmp_path / 'clip.wav'
+    sf.write(clip, np.zeros(16000, dtype=np.float32), 16000)
+    with open(clip, 'rb') as f:
+        response = client.post('/upload_file', files={'file': ('clip.wav', f, 'audio/wav')})
+
+    result = events(response)[-1]['result']
+    assert result['success'] is False
+    assert 'stopped unexpectedly' in result['message']
+    assert asgi.pool is replacement
+    assert warmed == [replacement]
+    assert warmup.readiness.state == 'warming'
+    assert len(asgi.inflight) == 0
+    assert asgi.governor.running == 0
+    replacement.shutdown()
@@ -0,0 +1,88 @@
+import asyncio
+import hashlib
+import io
+import threading
+
+from coalesce import AsyncJob, Job, SingleFlight, save_and_hash
+
+
+def test_save_and_hash_streams_to_disk(tmp_path):
+    data = bytes(range(256)) * 1000
+    path = tmp_path / 'upload.wav'
+    digest, size = save_and_hash(io.BytesIO(data), str(path), max_size=len(data), chunk_size=4096)
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert size == len(data)
+    assert path.read_bytes() == data
+
+
+def test_save_and_hash_removes_oversized_uploads(tmp_path):
+    path = tmp_path / 'upload.wav'
+    digest, size = save_and_hash(io.BytesIO(b'x' * 10_000), str(path), max_size=5000, chunk_size=1024)
+    assert digest is None
+    assert size > 5000
+    assert not path.exists()
+
+
+def test_single_flight_has_one_leader_per_key():
+    flight = SingleFlight()
+    job, leader = flight.acquire('a')
+    follower_job, follower = flight.acquire('a')
+    other_job, other = flight.acquire('b')
+    assert leader and not follower and other
+    assert follower_job is job and other_job is not job
+    assert len(flight) == 2
+
+    flight.release('a')
+    again, leader_again = flight.acquire('a')
+    assert leader_again and again is not job
+
+
+def test_single_flight_elects_one_leader_across_threads():
+    flight = SingleFlight()
+    barrier = threading.Barrier(16)
+    leaders = []
+
+    def request():
+        barrier.wait()
+        leaders.append(flight.acquire('same audio')[1])
+
+    threads = [threading.Thread(target=request) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert leaders.count(True) == 1
+
+
+def test_job_replays_events_to_late_subscribers():
+    job = Job('a')
+    job.publish('estimate')
+    received = []
+    early = threading.Thread(target=lambda: received.append(list(job.subscribe())))
+    early.start()
+    job.publish('result', final=True)
+    early.join(timeout=5)
+
+    assert received == [['estimate', 'result']]
+    assert list(job.subscribe()) == ['estimate', 'result']
+
+
+def test_async_job_wakes_every_subscriber():
+    async def scenario():
+        job = AsyncJob('a')
+        job.publish('estimate')
+
+        async def collect():
+            return [event async for event in job.subscribe()]
+
+        subscribers = [asyncio.create_task(collect()) for _ in range(3)]
+        await asyncio.sleep(0)
+        job.publish('progress')
+        await asyncio.sleep(0)
+        job.publish('result', final=True)
+        late = await collect()
+        return await asyncio.gather(*subscribers), late
+
+    subscribers, late = asyncio.run(scenario())
+    assert subscribers == [['estimate', 'progress', 'result']] * 3
+    assert late == ['estimate', 'progress', 'result']
@@ -0,0 +1,70 @@
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+
+import vad
+from create_predict_data import extract_features, load_signal
+
+SR = 16000
+
+
+def speech_like(seconds, gaps=False, sr=SR):
+    # Syllable-rate bursts of a 160 Hz tone; with gaps, 10 s of speech then 10 s of silence
+    t = np.arange(int(seconds * sr)) / sr
+    y = 0.2 * np.sin(2 * np.pi * 160 * t) * np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+    if gaps:
+        y[np.floor(t / 10) % 2 == 1] = 0
+    y += 1e-4 * np.random.default_rng(0).standard_normal(len(t))
+    return np.ascontiguousarray(y, dtype=np.float32)
+
+
+def traced_peak(function, *args, **kwargs):
+    tracemalloc.start()
+    try:
+        result = function(*args, **kwargs)
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def peak_growth(make_signal, short=120, long=360, **kwargs):
+    # openSMILE and the VAD allocate a fixed amount per segment and per frame
+    # block; the difference between two durations leaves only the buffers
+    # that scale with the signal
+    extract_features(make_signal(5), SR, use_vad=True)  # load openSMILE before tracing
+    signals = make_signal(short), make_signal(long)
+    peaks = [traced_peak(extract_features, y, SR, use_vad=True, **kwargs)[1] for y in signals]
+    return peaks[1] - peaks[0], signals
+
+
+def test_single_speech_region_is_not_copied():
+    growth, signals = peak_growth(lambda seconds: speech_like(seconds))
+    assert growth < 0.1 * (signals[1].nbytes - signals[0].nbytes)
+
+
+def test_speech_is_copied_once():
+    growth, signals = peak_growth(lambda seconds: speech_like(seconds, gaps=True))
+    speech_bytes = [vad.keep_speech(y, SR)[0].nbytes for y in signals]
+    expected = speech_bytes[1] - speech_bytes[0]
+    assert 0.9 * expected < growth < 1.1 * expected
+
+
+def test_features_fill_one_preallocated_array():
+    y = speech_like(200)
+    features, report, timings, segments = extract_features(y, SR, use_vad=True, max_segments=2)
+    assert features.dtype == np.float32
+    assert features.shape == (2, 88)
+    assert segments == {'total': 4, 'analysed': 2}
+    assert set(timings) == {'vad', 'extract'}
+    assert report is not None
+
+
+def test_load_signal_keeps_one_copy_at_the_target_rate(tmp_path):
+    path = str(tmp_path / 'clip.wav')
+    sf.write(path, speech_like(120), SR)
+    load_signal(path)  # librosa imports its backends lazily on first use
+    (y, sr), peak = traced_peak(load_signal, path)
+    assert sr == SR and y.dtype == np.float32 and y.flags.c_contiguous
+    # The decoded signal is returned as is; only librosa's finiteness mask comes on top
+    assert peak < 1.5 * y.nbytes
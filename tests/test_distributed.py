@@ -0,0 +1,112 @@
+import time
+
+import numpy as np
+import soundfile as sf
+
+import distributed
+from distributed import InMemoryBroker, shard_manifest
+from feature_store import FeatureStore
+
+
+def unit(unit_id):
+    return {'id': unit_id, 'files': []}
+
+
+def test_submit_skips_known_units():
+    broker = InMemoryBroker()
+    assert broker.submit([unit('a'), unit('b')]) == 2
+    assert broker.submit([unit('a')]) == 0
+    assert broker.status()['pending'] == 2
+
+
+def test_ack_completes_unit():
+    broker = InMemoryBroker()
+    broker.submit([unit('a')])
+    assert broker.lease('w1')['id'] == 'a'
+    assert not broker.finished()
+    assert broker.ack('a', 'w1')
+    assert broker.finished()
+    assert broker.status()['done'] == 1
+
+
+def test_nack_retries_then_fails():
+    broker = InMemoryBroker(max_attempts=2)
+    broker.submit([unit('a')])
+    broker.lease('w1')
+    assert broker.nack('a', 'w1', 'first')
+    broker.lease('w1')
+    assert broker.nack('a', 'w1', 'second')
+    status = broker.status()
+    assert status['failed'] == {'a': 'second'}
+    assert broker.finished()
+
+
+def test_expired_leases_count_as_attempts():
+    # A worker that dies without nacking must not keep the run alive forever
+    broker = InMemoryBroker(lease_seconds=0.01, max_attempts=2)
+    broker.submit([unit('a')])
+    for _ in range(2):
+        assert broker.lease('w1')['id'] == 'a'
+        time.sleep(0.02)
+    assert broker.lease('w1') is None
+    assert broker.finished()
+    assert 'a' in broker.status()['failed']
+
+
+def test_stale_worker_cannot_ack_or_nack():
+    broker = InMemoryBroker(lease_seconds=0.01, max_attempts=3)
+    broker.submit([unit('a')])
+    broker.lease('w1')
+    time.sleep(0.02)
+    assert broker.lease('w2')['id'] == 'a'
+
+    # The late nack from w1 must leave w2's lease alone and not queue the unit again
+    assert not broker.nack('a', 'w1', 'late')
+    assert not broker.ack('a', 'w1')
+    assert broker.status()['leased'] == 1
+    assert broker.status()['pending'] == 0
+
+    assert broker.ack('a', 'w2')
+    assert broker.finished()
+
+
+def test_shard_ids_are_stable(tmp_path):
+    files = []
+    for i in range(5):
+        path = tmp_path / f'clip_{i}.wav'
+        path.write_bytes(b'x' * (i + 1))
+        files.append(str(path))
+    first = shard_manifest(files, unit_size=2)
+    assert [len(u['files']) for u in first] == [2, 2, 1]
+    assert [u['id'] for u in shard_manifest(files, unit_size=2)] == [u['id'] for u in first]
+
+
+def run_one_unit(tmp_path, monkeypatch, files):
+    broker = InMemoryBroker(max_attempts=2)
+    broker.submit([{'id': 'u1', 'files': files}])
+    monkeypatch.setattr(distributed, 'connect', lambda address, authkey: broker)
+    store_dir = str(tmp_path / 'store')
+    distributed.run_worker(None, None, store_dir, use_vad=False, poll_seconds=0.01)
+    return broker.status(), FeatureStore(store_dir)
+
+
+def test_unit_with_a_failed_file_is_not_committed(tmp_path, monkeypatch):
+    good = str(tmp_path / 'adhd_good.wav')
+    t = np.arange(16000) / 16000
+    sf.write(good, (0.2 * np.sin(2 * np.pi * 160 * t)).astype(np.float32), 16000)
+    broken = tmp_path / 'control_broken.wav'
+    broken.write_bytes(b'not audio')
+
+    status, store = run_one_unit(tmp_path, monkeypatch, [good, str(broken)])
+    assert not store.has_block('u1')
+    assert status['done'] == 0
+    assert '1 of 2 files failed' in status['failed']['u1']
+    assert str(broken) in status['failed']['u1']
+    assert good not in status['failed']['u1']
+
+
+def test_unit_where_every_file_fails(tmp_path, monkeypatch):
+    missing = [str(tmp_path / f'missing_{i}.wav') for i in range(2)]
+    status, store = run_one_unit(tmp_path, monkeypatch, missing)
+    assert store.block_ids() == []
+    assert '2 of 2 files failed' in status['failed']['u1']
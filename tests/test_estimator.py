@@ -0,0 +1,48 @@
+import numpy as np
+
+from estimator import STAGES, ProcessingTimeEstimator
+
+
+def wav(minutes):
+    # WAV-only traffic: the mp3 column is always zero and size tracks duration
+    return {'duration': minutes * 60, 'format': 'WAV', 'bitrate': 705600,
+            'size': minutes * 60 * 705600 / 8}
+
+
+def stage_times(minutes, scale=1.0):
+    return {'decode': scale * (0.2 + 0.1 * minutes), 'vad': scale * 0.01 * minutes,
+            'extract': scale * (0.5 + 0.9 * minutes), 'predict': 0.01}
+
+
+def feed(estimator, n, rng, scale=1.0):
+    for _ in range(n):
+        description = wav(rng.uniform(1, 30))
+        timings = stage_times(description['duration'] / 60, scale)
+        estimator.observe(description, timings, estimator.estimate(description),
+                          sum(timings.values()))
+
+
+def test_same_format_traffic_stays_finite():
+    estimator = ProcessingTimeEstimator()
+    feed(estimator, 10_000, np.random.default_rng(0))
+
+    for stage in STAGES:
+        model = estimator.models[stage]
+        assert np.all(np.isfinite(model.P))
+        assert np.all(np.isfinite(model.w))
+        assert np.linalg.eigvalsh(model.P).max() <= model.delta * (1 + 1e-9)
+
+    truth = sum(stage_times(10).values())
+    assert abs(estimator.estimate(wav(10)) - truth) < 0.01 * truth
+    stats = estimator.stats()
+    assert np.isfinite(stats['mae_seconds'])
+
+
+def test_follows_a_slowdown():
+    estimator = ProcessingTimeEstimator()
+    rng = np.random.default_rng(1)
+    feed(estimator, 2_000, rng)
+    feed(estimator, 500, rng, scale=2.0)
+
+    truth = sum(stage_times(10, scale=2.0).values())
+    assert abs(estimator.estimate(wav(10)) - truth) < 0.05 * truth
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+import feature_sets
+
+SR = 16000
+
+
+def speech_like(seconds=2, sr=SR):
+    t = np.arange(int(seconds * sr)) / sr
+    f0 = 160 + 20 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+    noise = 1e-3 * np.random.default_rng(0).standard_normal(len(t))
+    return (0.2 * voice * envelope + noise).astype(np.float32)
+
+
+@pytest.mark.parametrize('set_names', [
+    ['egemaps'],
+    ['librosa'],
+    ['egemaps', 'librosa'],
+    ['egemaps_lld', 'librosa'],
+    ['egemaps', 'egemaps_lld', 'compare', 'librosa'],
+])
+def test_names_match_the_extracted_vector(set_names):
+    names = feature_sets.feature_names(set_names)
+    vector = feature_sets.extract(feature_sets.SignalContext(speech_like(), SR), set_names)
+    assert vector.dtype == np.float32
+    assert vector.shape == (len(names),)
+    assert len(set(names)) == len(names)
+    if len(set_names) > 1:
+        assert [name.split(':')[0] for name in names] == [
+            set_name for set_name in set_names
+            for _ in feature_sets.FEATURE_SETS[set_name].feature_names]
+
+
+def test_shared_stft_is_computed_once(monkeypatch):
+    calls = []
+    stft = feature_sets.librosa.stft
+
+    def counting_stft(*args, **kwargs):
+        calls.append(1)
+        return stft(*args, **kwargs)
+
+    # librosa's own feature functions call the stft in its spectrum module
+    monkeypatch.setattr(feature_sets.librosa, 'stft', counting_stft)
+    monkeypatch.setattr(feature_sets.librosa.core.spectrum, 'stft', counting_stft)
+    context = feature_sets.SignalContext(speech_like(), SR)
+    # MFCCs go through the mel spectrogram and the spectral shape through the
+    # magnitude; both come from the one cached STFT
+    feature_sets.extract(context, ['egemaps', 'librosa'])
+    feature_sets.extract(context, ['librosa'])
+    assert len(calls) == 1
@@ -0,0 +1,110 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_store import UNLABELLED, FeatureStore
+
+
+def block(seed, rows=20, features=5):
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((rows, features)), rng.integers(0, 2, rows)
+
+
+def test_put_block_round_trips(tmp_path):
+    store = FeatureStore(str(tmp_path))
+    X, y = block(0)
+    block_id = store.put_block(X, y, feature_names=list('abcde'))
+
+    X_read, y_read, index = store.read_block(block_id)
+    assert isinstance(X_read, np.memmap) and X_read.dtype == np.float32
+    np.testing.assert_array_equal(X_read, X.astype(np.float32))
+    np.testing.assert_array_equal(y_read, y)
+    assert list(index) == [str(i) for i in range(len(X))]
+    assert store.feature_names == list('abcde')
+
+
+def test_unlabelled_rows_default_to_unlabelled(tmp_path):
+    store = FeatureStore(str(tmp_path))
+    _, y, _ = store.read_block(store.put_block(block(0)[0]))
+    assert (y == UNLABELLED).all()
+
+
+def test_same_content_is_committed_once(tmp_path):
+    store = FeatureStore(str(tmp_path))
+    X, y = block(0)
+    first = store.put_block(X, y)
+    assert store.put_block(X, y) == first
+    assert store.put_block(*block(1)) != first
+    assert len(store.block_ids()) == 2
+
+
+def test_explicit_block_id_is_not_overwritten(tmp_path):
+    store = FeatureStore(str(tmp_path))
+    store.put_block(*block(0), block_id='shard-0')
+    store.put_block(*block(1), block_id='shard-0')
+    X, _, _ = store.read_block('shard-0')
+    np.testing.assert_array_equal(X, block(0)[0].astype(np.float32))
+
+
+def test_concurrent_writers_leave_one_complete_block(tmp_path):
+    store = FeatureStore(str(tmp_path))
+    barrier = threading.Barrier(8)
+    results, errors = [], []
+
+    def write(seed):
+        barrier.wait()
+        try:
+            results.append(store.put_block(*block(seed, rows=5000), block_id='shard-0'))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert results == ['shard-0'] * 8
+    assert os.listdir(store.blocks_dir) == ['shard-0']
+    X, y, _ = store.read_block('shard-0')
+    # Whichever writer won, the block is one writer's complete data
+    assert any(np.array_equal(X, block(seed, rows=5000)[0].astype(np.float32)) and
+               np.array_equal(y, block(seed, rows=5000)[1]) for seed in range(8))
+
+
+def test_rejects_mismatched_blocks(tmp_path):
+    store = FeatureStore(str(tmp_path))
+    X, y = block(0)
+    store.put_block(X, y, feature_names=list('abcde'))
+    with pytest.raises(ValueError):
+        store.put_block(*block(1), feature_names=list('vwxyz'))
+    with pytest.raises(ValueError):
+        store.put_block(X, y[:-1])
+
+
+def test_iter_blocks_skips_consumed_blocks(tmp_path):
+    store = FeatureStore(str(tmp_path))
+    ids = [store.put_block(*block(seed), block_id=f'b{seed}') for seed in range(3)]
+    assert [block_id for block_id, _, _ in store.iter_blocks(exclude=ids[:1])] == ids[1:]
+
+
+def test_import_csv_is_idempotent(tmp_path):
+    X, y = block(0, rows=25)
+    df = pd.DataFrame(X, columns=list('abcde'), index=[f'file{i}.wav' for i in range(25)])
+    df['label'] = y
+    csv_file = tmp_path / 'features.csv'
+    df.to_csv(csv_file)
+
+    store = FeatureStore(str(tmp_path / 'store'))
+    ids = store.import_csv(str(csv_file), chunksize=10)
+    assert ids == ['features-00000', 'features-00001', 'features-00002']
+    assert store.import_csv(str(csv_file), chunksize=10) == ids
+    assert store.block_ids() == ids
+    assert store.feature_names == list('abcde')
+    _, labels, index = store.read_block(ids[-1])
+    np.testing.assert_array_equal(labels, y[20:])
+    assert list(index) == [f'file{i}.wav' for i in range(20, 25)]
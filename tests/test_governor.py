@@ -0,0 +1,134 @@
+import threading
+import time
+
+import pytest
+
+import numpy as np
+import soundfile as sf
+
+from estimator import DEFAULT_CHANNELS, describe_file
+from governor import (FAST_RESAMPLER, FULL_QUALITY_RESAMPLER, MB, MIN_DURATION,
+                      NATIVE_BYTES_PER_SAMPLE, PRESSURE_MAX_SEGMENTS, Overloaded, ResourceGovernor,
+                      estimate_job_memory)
+
+
+def upload(minutes, samplerate=16000, channels=1):
+    return {'duration': minutes * 60, 'samplerate': samplerate, 'channels': channels}
+
+
+def governor(**kwargs):
+    settings = dict(memory_budget=1024 * MB, job_memory_limit=512 * MB, max_jobs=2,
+                    max_queue=1, queue_seconds=5)
+    settings.update(kwargs)
+    return ResourceGovernor(**settings)
+
+
+def test_small_job_runs_unchanged():
+    plan = governor().plan(upload(5))
+    assert plan['degraded'] == []
+    assert plan['max_duration'] is None
+    assert plan['res_type'] == FULL_QUALITY_RESAMPLER
+    assert plan['max_segments'] is None
+    assert plan['memory_bytes'] == estimate_job_memory(300, 16000)
+
+
+def test_long_job_is_capped_to_the_job_limit():
+    plan = governor().plan(upload(600, samplerate=48000))
+    assert plan['degraded'] == ['duration_capped']
+    assert MIN_DURATION <= plan['max_duration'] < 600 * 60
+    assert plan['memory_bytes'] <= 512 * MB
+
+
+def test_channels_scale_the_native_rate_term():
+    mono = estimate_job_memory(600, 44100)
+    stereo = estimate_job_memory(600, 44100, channels=2)
+    assert stereo - mono == 600 * 44100 * NATIVE_BYTES_PER_SAMPLE
+
+    gov = governor()
+    assert gov.plan(upload(10, 44100, channels=2))['memory_bytes'] == stereo
+    # Stereo fills the per-job limit sooner, so its duration is capped harder
+    capped = [gov.plan(upload(600, 48000, channels=channels))['max_duration']
+              for channels in (1, 2)]
+    assert capped[1] < capped[0]
+
+
+def test_missing_channel_count_is_assumed_stereo():
+    description = {'duration': 600, 'samplerate': 44100}
+    assert governor().plan(description)['memory_bytes'] == \
+        estimate_job_memory(600, 44100, channels=DEFAULT_CHANNELS)
+
+
+def test_describe_file_reports_channels(tmp_path):
+    path = str(tmp_path / 'stereo.wav')
+    sf.write(path, np.zeros((8000, 2), dtype=np.float32), 8000)
+    description = describe_file(path)
+    assert description['channels'] == 2
+    assert description['samplerate'] == 8000
+    assert description['duration'] == 1.0
+
+
+def test_pressure_switches_to_the_fast_path():
+    plan = governor().plan(upload(5), pressure=True)
+    assert plan['res_type'] == FAST_RESAMPLER
+    assert plan['max_segments'] == PRESSURE_MAX_SEGMENTS
+    assert plan['degraded'] == ['fast_resampler', 'segments_sampled']
+
+
+def test_admit_reserves_and_release_returns_memory():
+    gov = governor()
+    plan = gov.admit(upload(5))
+    assert gov.running == 1 and gov.reserved == plan['memory_bytes']
+    gov.release(plan)
+    assert gov.running == 0 and gov.reserved == 0
+    assert gov.stats()['admitted'] == 1
+
+
+def test_rejects_when_the_queue_is_full():
+    gov = governor(max_jobs=1, max_queue=0)
+    plan = gov.admit(upload(5))
+    with pytest.raises(Overloaded):
+        gov.admit(upload(5))
+    assert gov.rejected == 1
+    gov.release(plan)
+
+
+def test_rejects_after_waiting_too_long():
+    gov = governor(max_jobs=1, queue_seconds=0.05)
+    plan = gov.admit(upload(5))
+    start = time.monotonic()
+    with pytest.raises(Overloaded):
+        gov.admit(upload(5))
+    assert time.monotonic() - start >= 0.05
+    assert gov.waiting == 0
+    gov.release(plan)
+
+
+def test_queued_job_starts_when_a_slot_frees():
+    gov = governor(max_jobs=1)
+    first = gov.admit(upload(5))
+    plans = []
+    waiter = threading.Thread(target=lambda: plans.append(gov.admit(upload(5))))
+    waiter.start()
+    while gov.waiting == 0:
+        time.sleep(0.01)
+    assert not plans
+
+    gov.release(first)
+    waiter.join(timeout=5)
+    assert len(plans) == 1 and gov.running == 1
+    gov.release(plans[0])
+
+
+def test_jobs_share_the_memory_budget():
+    gov = governor(memory_budget=600 * MB, max_jobs=4, queue_seconds=0.05)
+    first = gov.admit(upload(30, samplerate=48000))
+    # The second job only gets what the first left over
+    second = gov.admit(upload(30, samplerate=48000))
+    assert 'duration_capped' in second['degraded']
+    assert second['max_duration'] < first['max_duration']
+    assert gov.reserved <= gov.memory_budget
+    # Not even MIN_DURATION fits any more: the third job waits and times out
+    with pytest.raises(Overloaded):
+        gov.admit(upload(30, samplerate=48000))
+    gov.release(second)
+    gov.release(first)
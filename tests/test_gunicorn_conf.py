@@ -0,0 +1,21 @@
+import os
+import runpy
+
+import profiling
+import warmup
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      'gunicorn.conf.py')
+
+
+def test_failed_warm_up_keeps_the_worker_alive_but_not_ready(monkeypatch):
+    def broken():
+        raise RuntimeError('model artifacts missing')
+
+    monkeypatch.setattr(warmup, 'warm_up', broken)
+    monkeypatch.setattr(profiling, 'start_continuous', lambda: None)
+    monkeypatch.setattr(warmup, 'readiness', warmup.Readiness())
+
+    runpy.run_path(CONFIG)['post_worker_init'](worker=None)
+    assert not warmup.readiness.ready
+    assert warmup.readiness.status() == {'status': 'failed', 'error': 'model artifacts missing'}
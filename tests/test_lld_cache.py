@@ -0,0 +1,102 @@
+import numpy as np
+import opensmile
+import pytest
+
+import lld_cache
+from feature_sets import get_smile
+
+SR = 16000
+N_STATS = len(lld_cache.STATISTICS)
+
+
+def frames(seconds, seed=0):
+    # Random descriptors with every frame voiced
+    rng = np.random.default_rng(seed)
+    values = rng.uniform(1, 2, size=(int(seconds * lld_cache.FRAME_RATE), 25))
+    return values.astype(np.float32)
+
+
+def column(name, stat):
+    return lld_cache.functional_names().index(f'{name}_{stat}')
+
+
+@pytest.mark.parametrize('seconds, hop, include_partial, expected', [
+    (250, None, True, 5),    # starts 0, 60, 120, 180 and a 10 s tail at 240
+    (250, None, False, 4),
+    (250, 30, True, 9),      # starts 0..180 every 30 s, then tails at 210 and 240
+    (250, 30, False, 7),
+    (120, None, True, 2),    # no tail when the windows fit exactly
+    (30, None, True, 1),     # shorter than one window
+    (30, None, False, 0),
+])
+def test_window_counts(seconds, hop, include_partial, expected):
+    features = lld_cache.window_functionals(frames(seconds), 60, hop, include_partial)
+    assert features.shape == (expected, 25 * N_STATS)
+
+
+def test_partial_window_covers_the_tail():
+    values = frames(250)
+    features = lld_cache.window_functionals(values, 60)
+    tail = lld_cache.window_functionals(values[240 * lld_cache.FRAME_RATE:], 60)
+    np.testing.assert_array_equal(features[-1], tail[0])
+
+
+def test_voiced_descriptors_follow_the_f0_mask():
+    names = lld_cache.lld_names()
+    values = frames(2)
+    f0, hnr, f1 = (names.index(name) for name in
+                   (lld_cache.F0_NAME, 'HNRdBACF_sma3nz', 'F1frequency_sma3nz'))
+    values[:100, f0] = 0                 # first second unvoiced
+    values[:100, f1] = 5000              # formants are still tracked there
+    values[100:, f1] = 700
+    values[100:150, hnr] = 0             # a voiced frame with 0 dB HNR still counts
+    values[150:, hnr] = 10
+
+    features = lld_cache.window_functionals(values, 2)[0]
+    assert features[column('F1frequency_sma3nz', 'amean')] == pytest.approx(700)
+    assert features[column('HNRdBACF_sma3nz', 'amean')] == pytest.approx(5)
+
+
+def test_stddev_norm_keeps_the_sign_of_the_mean():
+    values = frames(2)
+    values[:, 0] = np.tile([-1.0, -3.0], 100)
+    features = lld_cache.window_functionals(values, 2)[0]
+    assert features[column('Loudness_sma3', 'stddevNorm')] == pytest.approx(-0.5)
+
+
+def synthetic_speech(seconds=6):
+    t = np.arange(seconds * SR) / SR
+    f0 = 160 + 30 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / SR
+    voice = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = np.clip(np.sin(2 * np.pi * 3 * t), 0, None)
+    noise = 1e-3 * np.random.default_rng(0).standard_normal(len(t))
+    return (0.2 * voice * envelope + noise).astype(np.float32)
+
+
+def test_matches_opensmile_functionals():
+    y = synthetic_speech()
+    lld = get_smile(opensmile.FeatureSet.eGeMAPSv02,
+                    opensmile.FeatureLevel.LowLevelDescriptors).process_signal(y, SR)
+    reference = get_smile(opensmile.FeatureSet.eGeMAPSv02,
+                          opensmile.FeatureLevel.Functionals).process_signal(y, SR).iloc[0]
+    values = lld.to_numpy(dtype=np.float32)
+    ours = dict(zip(lld_cache.functional_names(),
+                    lld_cache.window_functionals(values, len(values) / lld_cache.FRAME_RATE)[0]))
+    reference = {name.lower(): value for name, value in reference.items()}
+
+    def compare(names, rtol):
+        for name in names:
+            for stat in lld_cache.STATISTICS:
+                key = f'{name}_{stat}'
+                if key.lower() in reference:
+                    assert ours[key] == pytest.approx(reference[key.lower()], rel=rtol), key
+
+    # Voiced descriptors select the same frames as openSMILE, so they agree exactly
+    compare(['F0semitoneFrom27.5Hz_sma3nz', 'jitterLocal_sma3nz', 'shimmerLocaldB_sma3nz',
+             'HNRdBACF_sma3nz', 'logRelF0-H1-H2_sma3nz', 'logRelF0-H1-A3_sma3nz'], 1e-4)
+    # The rest only agree to a few percent: openSMILE's functionals component
+    # does not see exactly the frames the LLD output returns
+    compare(['Loudness_sma3', 'spectralFlux_sma3', 'mfcc1_sma3', 'mfcc2_sma3', 'mfcc3_sma3',
+             'mfcc4_sma3', 'F1frequency_sma3nz', 'F2frequency_sma3nz', 'F3frequency_sma3nz'],
+            0.05)
@@ -0,0 +1,98 @@
+import json
+import os
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+from model_registry import LEGACY_VERSION, ModelRegistry, load_version
+
+SERVING = [f'feature_{i}' for i in range(6)]
+
+
+def export(root, version, n_features, feature_names=None, **metadata):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(40, n_features))
+    y = (X[:, 0] > 0).astype(int)
+    model = make_pipeline(StandardScaler(), LogisticRegression()).fit(X, y)
+    os.makedirs(os.path.join(root, version))
+    joblib.dump(model, os.path.join(root, version, 'model.joblib'))
+    if feature_names is not None:
+        with open(os.path.join(root, version, 'metadata.json'), 'w') as f:
+            json.dump(dict(metadata, feature_names=feature_names), f)
+
+
+def write_config(root, routes, shadow=()):
+    with open(os.path.join(root, 'registry.json'), 'w') as f:
+        json.dump({'routes': routes, 'shadow': list(shadow)}, f)
+
+
+def test_rejects_wrong_column_count(tmp_path):
+    export(tmp_path, 'wide', 10)
+    with pytest.raises(ValueError, match='expects 10 features'):
+        load_version(str(tmp_path), 'wide', SERVING)
+
+
+def test_rejects_other_feature_names(tmp_path):
+    export(tmp_path, 'renamed', 6, [f'egemaps:{name}' for name in SERVING])
+    with pytest.raises(ValueError, match='different features'):
+        load_version(str(tmp_path), 'renamed', SERVING)
+
+
+def test_rejects_other_vad_setting(tmp_path):
+    export(tmp_path, 'vad', 6, SERVING, use_vad=True)
+    assert load_version(str(tmp_path), 'vad', SERVING, use_vad=True) is not None
+    with pytest.raises(ValueError, match='trained with VAD'):
+        load_version(str(tmp_path), 'vad', SERVING, use_vad=False)
+
+
+def test_versions_without_a_recorded_setting_were_trained_without_vad(tmp_path, monkeypatch):
+    export(tmp_path, 'old', 6, SERVING)
+    assert load_version(str(tmp_path), 'old', SERVING, use_vad=False) is not None
+    with pytest.raises(ValueError, match='trained without VAD'):
+        load_version(str(tmp_path), 'old', SERVING, use_vad=True)
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    monkeypatch.chdir(root)
+    assert load_version(str(tmp_path), LEGACY_VERSION, use_vad=False) is not None
+    with pytest.raises(ValueError, match='trained without VAD'):
+        load_version(str(tmp_path), LEGACY_VERSION, use_vad=True)
+
+
+def test_registry_drops_mismatched_versions(tmp_path):
+    export(tmp_path, 'good', 6, SERVING)
+    export(tmp_path, 'wide', 10)
+    export(tmp_path, 'vad', 6, SERVING, use_vad=True)
+    write_config(tmp_path, {'good': 0.5, 'wide': 0.5}, shadow=['wide', 'vad'])
+
+    registry = ModelRegistry(str(tmp_path), feature_names=SERVING, use_vad=False)
+    assert registry.describe() == {'routes': {'good': 1.0}, 'shadow': [], 'loaded': ['good']}
+
+    version, probabilities, shadow = registry.score(np.zeros((3, 6)), route_key='abc')
+    assert version == 'good'
+    assert probabilities.shape == (3,)
+    assert shadow == []
+
+
+def test_registry_fails_without_a_servable_route(tmp_path):
+    export(tmp_path, 'wide', 10)
+    write_config(tmp_path, {'wide': 1})
+    with pytest.raises(ValueError, match='No routed model version'):
+        ModelRegistry(str(tmp_path), feature_names=SERVING)
+
+
+def test_shadow_records_are_aggregated(tmp_path):
+    export(tmp_path, 'a', 6, SERVING)
+    export(tmp_path, 'b', 6, SERVING)
+    write_config(tmp_path, {'a': 1}, shadow=['b'])
+
+    registry = ModelRegistry(str(tmp_path), feature_names=SERVING)
+    for _ in range(3):
+        _, _, shadow = registry.score(np.ones((2, 6)))
+        assert [record['shadow'] for record in shadow] == ['b']
+    stats = registry.shadow_stats()['b']
+    assert stats['requests'] == 3
+    assert stats['mean_abs_divergence'] == pytest.approx(0.0)
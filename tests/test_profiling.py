@@ -0,0 +1,65 @@
+import json
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import profiling
+
+MB = 1_000_000
+
+# Runs in another thread, from a file the profiled function does not live in
+OTHER_THREAD = compile(
+    "with stage('extract'):\n"
+    "    held.append(np.ones(4 * MB // 8))\n"
+    "    time.sleep(0.1)\n",
+    'other_request.py', 'exec')
+
+
+def allocate_with_neighbour(held):
+    neighbour = threading.Thread(target=exec, args=(OTHER_THREAD, {
+        'stage': profiling.stage, 'held': held, 'np': np, 'MB': MB, 'time': time}))
+    neighbour.start()
+    own = np.ones(2 * MB // 8)
+    neighbour.join()
+    return own
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', str(tmp_path))
+    return tmp_path
+
+
+def test_allocations_are_limited_to_the_profiled_code(profile_dir):
+    held = []
+    result, summary = profiling.profile_call('req', allocate_with_neighbour, held)
+    assert result.nbytes == 2 * MB
+
+    report = (profile_dir / 'req' / 'allocations.txt').read_text()
+    sites = report.split('Top 30 allocation sites:')[1]
+    assert __file__ in sites
+    assert 'other_request.py' not in sites
+    still_allocated = float(report.split('Still allocated at end:')[1].split('MB')[0])
+    assert 1.9 < still_allocated < 3.0
+
+    # The peak cannot be split by thread; the report says so and counts the neighbour
+    assert summary['peak_traced_mb'] >= 6.0
+    assert summary['concurrent_pipeline_threads'] == 1
+    assert 'Other pipeline threads during the run: 1' in report
+    saved = json.loads((profile_dir / 'req' / 'summary.json').read_text())
+    assert saved['concurrent_pipeline_threads'] == 1
+
+
+def test_profiled_stages_are_sampled(profile_dir):
+    def work():
+        with profiling.stage('extract'):
+            time.sleep(0.2)
+
+    _, summary = profiling.profile_call('stages', work)
+    assert summary['samples'] > 0
+    assert 'extract' in summary['stages']
+    assert summary['concurrent_pipeline_threads'] == 0
+    assert (profile_dir / 'stages' / 'flame.svg').exists()
+    assert (profile_dir / 'stages' / 'stacks.folded').read_text().startswith('[extract]')
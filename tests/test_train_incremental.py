@@ -0,0 +1,127 @@
+import json
+import os
+
+import joblib
+import numpy as np
+
+from feature_store import FeatureStore
+from train_incremental import fit_incremental, rebatch, update_incremental
+
+N_FEATURES = 6
+N_COMPONENTS = 3
+
+
+def labelled_block(seed, rows=20, shift=0.0):
+    rng = np.random.default_rng(seed)
+    y = rng.integers(0, 2, rows)
+    X = rng.standard_normal((rows, N_FEATURES)) + shift + y[:, None]
+    return X, y
+
+
+def make_store(path, n_blocks=4, **kwargs):
+    store = FeatureStore(str(path))
+    for seed in range(n_blocks):
+        store.put_block(*labelled_block(seed, **kwargs), block_id=f'b{seed}',
+                        feature_names=[f'f{i}' for i in range(N_FEATURES)])
+    return store
+
+
+def track_reads(monkeypatch):
+    reads = []
+    read_block = FeatureStore.read_block
+
+    def tracked(self, block_id, mmap=True):
+        reads.append(block_id)
+        return read_block(self, block_id, mmap=mmap)
+
+    monkeypatch.setattr(FeatureStore, 'read_block', tracked)
+    return reads
+
+
+def latest(model_root):
+    with open(os.path.join(model_root, 'LATEST')) as f:
+        version_dir = os.path.join(model_root, f.read().strip())
+    with open(os.path.join(version_dir, 'metadata.json')) as f:
+        metadata = json.load(f)
+    return joblib.load(os.path.join(version_dir, 'model.joblib')), metadata
+
+
+def test_rebatch_never_yields_a_short_batch():
+    blocks = [(str(i), np.zeros((rows, 2)), np.zeros(rows)) for i, rows in enumerate([2, 2, 2, 1])]
+    batches = list(rebatch(blocks, 3))
+    assert [len(X) for X, _ in batches] == [4, 3]
+    assert list(rebatch(blocks[:1], 3))[0][0].shape == (2, 2)
+
+
+def test_every_pass_reads_the_blocks_listed_up_front(tmp_path, monkeypatch):
+    store = make_store(tmp_path / 'store')
+    block_ids = FeatureStore.block_ids
+
+    def list_then_commit(self):
+        # Another writer commits a block right after the trainer lists the store
+        listed = block_ids(self)
+        if not self.has_block('late'):
+            self.put_block(*labelled_block(99), block_id='late')
+        return listed
+
+    monkeypatch.setattr(FeatureStore, 'block_ids', list_then_commit)
+    reads = track_reads(monkeypatch)
+    fit_incremental(store.root, model_root=str(tmp_path / 'models'),
+                    n_components=N_COMPONENTS, epochs=2)
+
+    assert 'late' not in reads
+    _, metadata = latest(str(tmp_path / 'models'))
+    assert metadata['consumed_blocks'] == ['b0', 'b1', 'b2', 'b3']
+    assert metadata['n_samples'] == 80
+
+
+def test_update_keeps_the_transforms_by_default(tmp_path, monkeypatch):
+    store = make_store(tmp_path / 'store')
+    models = str(tmp_path / 'models')
+    fit_incremental(store.root, model_root=models, n_components=N_COMPONENTS, epochs=2)
+    before, _ = latest(models)
+
+    store.put_block(*labelled_block(10, shift=5.0), block_id='new')
+    reads = track_reads(monkeypatch)
+    update_incremental(store.root, model_root=models)
+    after, metadata = latest(models)
+
+    assert set(reads) == {'new'}
+    np.testing.assert_array_equal(after.named_steps['scaler'].mean_,
+                                  before.named_steps['scaler'].mean_)
+    np.testing.assert_array_equal(after.named_steps['pca'].components_,
+                                  before.named_steps['pca'].components_)
+    assert not np.array_equal(after.named_steps['clf'].coef_, before.named_steps['clf'].coef_)
+    assert metadata['consumed_blocks'][-1] == 'new'
+    assert metadata['n_samples'] == 100
+    assert metadata['transforms_updated'] is False
+
+
+def test_updating_transforms_passes_the_classifier_over_everything(tmp_path, monkeypatch):
+    store = make_store(tmp_path / 'store')
+    models = str(tmp_path / 'models')
+    fit_incremental(store.root, model_root=models, n_components=N_COMPONENTS, epochs=2)
+    before, _ = latest(models)
+
+    store.put_block(*labelled_block(10, shift=5.0), block_id='new')
+    reads = track_reads(monkeypatch)
+    update_incremental(store.root, model_root=models, update_transforms=True)
+    after, metadata = latest(models)
+
+    assert set(reads) == {'b0', 'b1', 'b2', 'b3', 'new'}
+    # The scaler is frozen so the PCA's running statistics stay in one space
+    np.testing.assert_array_equal(after.named_steps['scaler'].mean_,
+                                  before.named_steps['scaler'].mean_)
+    np.testing.assert_array_equal(after.named_steps['scaler'].scale_,
+                                  before.named_steps['scaler'].scale_)
+    assert not np.allclose(after.named_steps['pca'].components_,
+                           before.named_steps['pca'].components_)
+    assert after.named_steps['pca'].n_samples_seen_ == before.named_steps['pca'].n_samples_seen_ + 20
+    assert metadata['transforms_updated'] is True
+
+
+def test_update_without_new_blocks_is_a_no_op(tmp_path):
+    store = make_store(tmp_path / 'store')
+    models = str(tmp_path / 'models')
+    fit_incremental(store.root, model_root=models, n_components=N_COMPONENTS, epochs=1)
+    assert update_incremental(store.root, model_root=models) is None
@@ -0,0 +1,113 @@
+import inspect
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import create_predict_data
+import create_train_test_data
+import distributed
+import feature_sets
+import vad
+
+SR = 16000
+
+
+def speech_then_silence(speech_seconds, silence_seconds, sr=SR):
+    t = np.arange(int(speech_seconds * sr)) / sr
+    voice = 0.2 * np.sin(2 * np.pi * 160 * t) * np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+    y = np.concatenate([voice, np.zeros(int(silence_seconds * sr))])
+    y += 1e-4 * np.random.default_rng(0).standard_normal(len(y))
+    return y.astype(np.float32)
+
+
+def test_single_speech_region_is_a_view():
+    y = speech_then_silence(4, 16)
+    speech, report = vad.keep_speech(y, SR)
+    assert np.shares_memory(speech, y)
+    assert 3.5 < len(speech) / SR < 4.5
+    assert report['discarded_seconds'] > 15
+
+
+def syllables(seconds, noise=1e-3, seed=0, sr=SR):
+    # Voiced bursts at syllable rate over a noise floor loud enough (about -60 dB)
+    # that the threshold comes from the noise, not from floor_db
+    t = np.arange(int(seconds * sr)) / sr
+    voice = 0.2 * np.sin(2 * np.pi * 160 * t) * np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+    return (voice + noise * np.random.default_rng(seed).standard_normal(len(t))).astype(np.float32)
+
+
+def test_syllables_are_merged_not_dropped():
+    energy_db, _ = vad.frame_stats(syllables(10), 480, 160)
+    assert np.percentile(energy_db, 10) + 12.0 > -55.0  # floor_db does not apply
+
+    speech, report = vad.keep_speech(syllables(10), SR)
+    assert report['speech_regions'] == 1
+    assert report['speech_seconds'] > 9.5
+
+
+def test_long_pauses_are_still_removed():
+    rng = np.random.default_rng(1)
+    pause = 1e-3 * rng.standard_normal(10 * SR).astype(np.float32)
+    y = np.concatenate([syllables(10), pause, syllables(10, seed=2)])
+    _, report = vad.keep_speech(y, SR)
+    assert report['speech_regions'] == 2
+    assert 19 < report['speech_seconds'] < 21
+
+
+def test_isolated_clicks_are_dropped():
+    y = 1e-3 * np.random.default_rng(3).standard_normal(10 * SR).astype(np.float32)
+    y[5 * SR:5 * SR + 800] += 0.3 * np.sin(2 * np.pi * 160 * np.arange(800) / SR)
+    _, report = vad.keep_speech(y, SR)
+    assert report['speech_seconds'] == 0.0
+
+
+@pytest.mark.parametrize('function', [
+    create_predict_data.extract_features,
+    create_predict_data.process_audio_files,
+    create_train_test_data.extract_egemaps,
+    create_train_test_data.process_audio_directory,
+    feature_sets.extract_file,
+    distributed.extract_unit,
+    distributed.run_worker,
+    distributed.run_local,
+])
+def test_training_and_serving_default_to_the_same_setting(function):
+    assert inspect.signature(function).parameters['use_vad'].default is vad.USE_VAD
+
+
+@pytest.mark.parametrize('value, expected', [(None, 'False'), ('0', 'False'), ('1', 'True')])
+def test_setting_comes_from_the_environment(value, expected):
+    # Off unless asked for: the legacy model was trained on whole recordings
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {key: val for key, val in os.environ.items() if key != 'ADHD_USE_VAD'}
+    if value is not None:
+        env['ADHD_USE_VAD'] = value
+    output = subprocess.run([sys.executable, '-c', 'import vad; print(vad.USE_VAD)'],
+                            cwd=root, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    assert output.strip() == expected
+
+
+def test_training_extraction_drops_silence(tmp_path):
+    path = str(tmp_path / 'clip.wav')
+    sf.write(path, speech_then_silence(4, 16), SR)
+    assert feature_sets.SignalContext.from_file(path, use_vad=False).duration == pytest.approx(20)
+    assert feature_sets.SignalContext.from_file(path, use_vad=True).duration < 5
+
+    with_vad = create_train_test_data.extract_egemaps(path, use_vad=True)
+    without_vad = create_train_test_data.extract_egemaps(path, use_vad=False)
+    assert with_vad.shape == without_vad.shape == (88,)
+    assert not np.allclose(with_vad, without_vad)
+
+
+def test_training_extraction_rejects_recordings_without_speech(tmp_path):
+    path = str(tmp_path / 'silence.wav')
+    sf.write(path, np.zeros(5 * SR, dtype=np.float32), SR)
+    with pytest.raises(ValueError):
+        feature_sets.extract_file(path, use_vad=True)
+    with pytest.raises(ValueError):
+        create_train_test_data.extract_egemaps(path, use_vad=True)
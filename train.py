@@ -0,0 +1,242 @@
+import os
+import json
+import hashlib
+import argparse
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Memory
+from scipy.stats import loguniform
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.decomposition import PCA, IncrementalPCA
+from sklearn.svm import SVC
+from sklearn.model_selection import RandomizedSearchCV, StratifiedKFold
+
+import vad
+
+# Corpora with more rows than this are reduced with IncrementalPCA so the
+# decomposition never needs the whole scaled matrix in one SVD
+INCREMENTAL_PCA_THRESHOLD = 100_000
+
+
+def load_features(features_file):
+    """
+    Load a feature CSV produced by create_train_test_data.py
+
+    Args:
+        features_file (str): Path to the features CSV (must contain a 'label' column)
+
+    Returns:
+        tuple: (features DataFrame, labels Series)
+    """
+    df = pd.read_csv(features_file, index_col=0)
+    if 'label' not in df.columns:
+        raise ValueError(f"{features_file} has no 'label' column")
+
+    X = df.drop('label', axis=1).astype(np.float32)
+    y = df['label'].astype(int)
+    return X, y
+
+
+def build_pipeline(n_samples, n_components=32, memory=None, random_state=42):
+    """
+    Build the scaler -> PCA -> classifier pipeline
+
+    Args:
+        n_samples (int): Number of training rows, used to pick the PCA variant
+        n_components (int): Number of principal components to keep
+        memory (joblib.Memory): Cache for fitted transformers (optional)
+        random_state (int): Seed for PCA and the classifier
+
+    Returns:
+        sklearn.pipeline.Pipeline: Unfitted pipeline
+    """
+    if n_samples > INCREMENTAL_PCA_THRESHOLD:
+        pca = IncrementalPCA(n_components=n_components, batch_size=10_000)
+    else:
+        pca = PCA(n_components=n_components, svd_solver='randomized',
+                  random_state=random_state)
+
+    return Pipeline([
+        ('scaler', StandardScaler()),
+        ('pca', pca),
+        ('clf', SVC(probability=True, random_state=random_state)),
+    ], memory=memory)
+
+
+def search_hyperparameters(pipeline, X, y, n_iter=30, cv=5, n_jobs=-1,
+                           random_state=42):
+    """
+    Run a cross-validated randomized search over PCA size and SVC parameters
+
+    Args:
+        pipeline (Pipeline): Pipeline returned by build_pipeline
+        X (pd.DataFrame): Training features
+        y (pd.Series): Training labels
+        n_iter (int): Number of parameter settings sampled
+        cv (int): Number of stratified folds
+        n_jobs (int): Parallel jobs for the search (-1 uses all cores)
+        random_state (int): Seed for sampling and fold shuffling
+
+    Returns:
+        RandomizedSearchCV: Fitted search object
+    """
+    # Components can never exceed the smallest training fold
+    max_components = min(X.shape[1], int(len(X) * (cv - 1) / cv))
+    component_choices = [n for n in (8, 16, 24, 32, 48, 64) if n <= max_components]
+    if not component_choices:
+        component_choices = [max_components]
+
+    param_distributions = {
+        'pca__n_components': component_choices,
+        'clf__C': loguniform(1e-2, 1e3),
+        'clf__gamma': ['scale', 'auto'] + list(np.logspace(-4, 0, 9)),
+        'clf__kernel': ['rbf'],
+    }
+
+    search = RandomizedSearchCV(
+        pipeline,
+        param_distributions,
+        n_iter=n_iter,
+        scoring='roc_auc',
+        cv=StratifiedKFold(n_splits=cv, shuffle=True, random_state=random_state),
+        n_jobs=n_jobs,
+        random_state=random_state,
+        refit=True,
+        verbose=1,
+    )
+    search.fit(X, y)
+    return search
+
+
+def data_fingerprint(X, y):
+    """
+    Short hash of the training data, used to tag exported artifacts
+
+    Args:
+        X (pd.DataFrame): Training features
+        y (pd.Series): Training labels
+
+    Returns:
+        str: 8 character hex digest
+    """
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(X.to_numpy()).tobytes())
+    digest.update(np.ascontiguousarray(y.to_numpy()).tobytes())
+    digest.update(','.join(X.columns).encode())
+    return digest.hexdigest()[:8]
+
+
+def export_artifacts(model, model_root, metadata):
+    """
+    Save a fitted pipeline as a new versioned artifact and mark it as latest
+
+    The layout is model_root/<version>/model.joblib plus metadata.json, and
+    model_root/LATEST holds the version name that predict.py loads.
+
+    Args:
+        model: Fitted estimator exposing predict_proba
+        model_root (str): Directory holding all model versions
+        metadata (dict): Training details stored next to the model
+
+    Returns:
+        str: Path to the version directory
+    """
+    timestamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    version = f"{timestamp}-{metadata.get('data_hash', 'nohash')}"
+    version_dir = os.path.join(model_root, version)
+    os.makedirs(version_dir, exist_ok=True)
+
+    joblib.dump(model, os.path.join(version_dir, 'model.joblib'))
+
+    metadata = dict(metadata, version=version, created_at=timestamp)
+    with open(os.path.join(version_dir, 'metadata.json'), 'w') as f:
+        json.dump(metadata, f, indent=2, default=str)
+
+    # Write the pointer last so a half-written version is never picked up
+    latest_tmp = os.path.join(model_root, 'LATEST.tmp')
+    with open(latest_tmp, 'w') as f:
+        f.write(version)
+    os.replace(latest_tmp, os.path.join(model_root, 'LATEST'))
+
+    return version_dir
+
+
+def train(features_file, model_root='models', cache_dir='.train_cache',
+          n_iter=30, cv=5, n_jobs=-1, random_state=42, use_vad=vad.USE_VAD):
+    """
+    Train, tune and export the ADHD classifier pipeline
+
+    Args:
+        features_file (str): Labelled feature CSV
+        model_root (str): Directory to export the versioned model into
+        cache_dir (str): joblib.Memory directory for fitted transformers (None disables)
+        n_iter (int): Randomized search iterations
+        cv (int): Cross-validation folds
+        n_jobs (int): Parallel jobs for the search
+        random_state (int): Seed for reproducibility
+        use_vad (bool): Whether features_file was extracted with VAD; recorded
+            so serving only routes to models matching its own setting
+
+    Returns:
+        str: Path to the exported version directory
+    """
+    print(f"Loading features from: {features_file}")
+    X, y = load_features(features_file)
+    print(f"Samples: {len(X)}, features: {X.shape[1]}, ADHD samples: {int(y.sum())}")
+
+    memory = Memory(cache_dir, verbose=0) if cache_dir else None
+    pipeline = build_pipeline(len(X), memory=memory, random_state=random_state)
+
+    print("\nRunning hyperparameter search...")
+    search = search_hyperparameters(pipeline, X, y, n_iter=n_iter, cv=cv,
+                                    n_jobs=n_jobs, random_state=random_state)
+    print(f"Best CV ROC AUC: {search.best_score_:.4f}")
+    print(f"Best parameters: {search.best_params_}")
+
+    # Drop the cache handle so the exported pipeline does not point at it
+    model = search.best_estimator_
+    model.set_params(memory=None)
+
+    metadata = {
+        'features_file': os.path.abspath(features_file),
+        'data_hash': data_fingerprint(X, y),
+        'n_samples': len(X),
+        'feature_names': list(X.columns),
+        'best_params': {k: getattr(v, 'item', lambda: v)()
+                        for k, v in search.best_params_.items()},
+        'cv_roc_auc': float(search.best_score_),
+        'cv_folds': cv,
+        'random_state': random_state,
+        'use_vad': bool(use_vad),
+    }
+    version_dir = export_artifacts(model, model_root, metadata)
+    print(f"\nModel exported to: {version_dir}")
+    return version_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the ADHD classifier pipeline")
+    parser.add_argument('--features', default='train_feature.csv',
+                        help="Labelled feature CSV from create_train_test_data.py")
+    parser.add_argument('--out', default='models', help="Model registry directory")
+    parser.add_argument('--cache-dir', default='.train_cache',
+                        help="joblib.Memory cache for fitted transformers ('' disables)")
+    parser.add_argument('--n-iter', type=int, default=30)
+    parser.add_argument('--cv', type=int, default=5)
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--vad', action=argparse.BooleanOptionalAction, default=vad.USE_VAD,
+                        help="Whether the features were extracted with VAD (default: ADHD_USE_VAD)")
+    args = parser.parse_args()
+
+    train(args.features, model_root=args.out, cache_dir=args.cache_dir or None,
+          n_iter=args.n_iter, cv=args.cv, n_jobs=args.n_jobs,
+          random_state=args.seed, use_vad=args.vad)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import os
+import json
+import hashlib
+import argparse
+
+import joblib
+import numpy as np
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.decomposition import IncrementalPCA
+from sklearn.linear_model import SGDClassifier
+
+import vad
+
+from feature_store import FeatureStore, UNLABELLED
+from train import export_artifacts
+
+CLASSES = np.array([0, 1])
+
+
+def blocks_fingerprint(block_ids):
+    """Short hash of the consumed block ids, used to tag exported artifacts"""
+    return hashlib.sha256(','.join(block_ids).encode()).hexdigest()[:8]
+
+
+def labelled_blocks(store, exclude=(), block_ids=None):
+    """
+    Stream labelled rows from the feature store block by block
+
+    Args:
+        store (FeatureStore): Store to read from
+        exclude (iterable): Block ids to skip
+        block_ids (list): Read only these blocks (defaults to every committed block)
+
+    Yields:
+        tuple: (block_id, X, y) with unlabelled rows removed
+    """
+    for block_id, X, y in store.iter_blocks(exclude=exclude, block_ids=block_ids):
+        mask = y != UNLABELLED
+        if mask.any():
+            yield block_id, np.asarray(X[mask]), y[mask].astype(int)
+
+
+def rebatch(blocks, min_rows):
+    """
+    Merge small blocks so every batch has at least min_rows rows
+
+    IncrementalPCA.partial_fit needs at least n_components rows in every
+    call, so a short remainder at the end is merged into the last batch.
+
+    Args:
+        blocks (iterable): (block_id, X, y) tuples
+        min_rows (int): Minimum rows per yielded batch
+
+    Yields:
+        tuple: (X, y)
+    """
+    pending_X, pending_y, n_pending = [], [], 0
+    batch = None
+    for _, X, y in blocks:
+        pending_X.append(X)
+        pending_y.append(y)
+        n_pending += len(X)
+        if n_pending >= min_rows:
+            if batch is not None:
+                yield batch
+            batch = np.concatenate(pending_X), np.concatenate(pending_y)
+            pending_X, pending_y, n_pending = [], [], 0
+    if pending_X:
+        if batch is not None:
+            pending_X.insert(0, batch[0])
+            pending_y.insert(0, batch[1])
+        batch = np.concatenate(pending_X), np.concatenate(pending_y)
+    if batch is not None:
+        yield batch
+
+
+def partial_fit_transforms(pipeline, X):
+    """
+    Update the PCA basis of an incremental pipeline with one batch
+
+    The scaler stays frozen. IncrementalPCA keeps running statistics of
+    everything it has seen in the scaled space; updating the scaler first
+    would feed it new batches in different coordinates from the ones those
+    statistics were built in. Changing the scaler needs a full fit.
+
+    Args:
+        pipeline (Pipeline): scaler -> ipca -> clf pipeline
+        X (np.ndarray): Feature batch with at least n_components rows
+    """
+    pipeline.named_steps['pca'].partial_fit(pipeline.named_steps['scaler'].transform(X))
+
+
+def partial_fit_classifier(pipeline, X, y):
+    """
+    Update the classifier of an incremental pipeline with one batch
+
+    Args:
+        pipeline (Pipeline): scaler -> ipca -> clf pipeline
+        X (np.ndarray): Feature batch
+        y (np.ndarray): Labels for the batch
+    """
+    pipeline.named_steps['clf'].partial_fit(pipeline[:-1].transform(X), y, classes=CLASSES)
+
+
+def fit_incremental(store_dir, model_root='models', n_components=32, epochs=5,
+                    random_state=42, use_vad=vad.USE_VAD):
+    """
+    Train a scaler -> IncrementalPCA -> SGD pipeline out of core
+
+    Each stage is fitted with its own pass over the store, so only one
+    block is in memory at a time and later stages see the final scaler and
+    PCA basis. The blocks are listed once up front and every pass reads
+    exactly those, so blocks committed while training neither reach only
+    some of the stages nor go missing from consumed_blocks.
+
+    Args:
+        store_dir (str): FeatureStore directory
+        model_root (str): Directory to export the versioned model into
+        n_components (int): Principal components to keep
+        epochs (int): Passes over the data for the classifier
+        random_state (int): Seed for the classifier
+        use_vad (bool): Whether the stored features were extracted with VAD;
+            recorded so serving only routes to models matching its own setting
+
+    Returns:
+        str: Path to the exported version directory
+    """
+    store = FeatureStore(store_dir)
+    block_ids = store.block_ids()
+    if not block_ids:
+        raise ValueError(f"No feature blocks found in {store_dir}")
+
+    scaler = StandardScaler()
+    ipca = IncrementalPCA(n_components=n_components)
+    clf = SGDClassifier(loss='log_loss', alpha=1e-4, random_state=random_state)
+
+    print("\nPass 1: fitting scaler...")
+    n_samples = 0
+    consumed = []
+    for block_id, X, _ in labelled_blocks(store, block_ids=block_ids):
+        scaler.partial_fit(X)
+        n_samples += len(X)
+        consumed.append(block_id)
+
+    print("Pass 2: fitting IncrementalPCA...")
+    for X, _ in rebatch(labelled_blocks(store, block_ids=consumed), n_components):
+        ipca.partial_fit(scaler.transform(X))
+
+    print(f"Pass 3: fitting classifier ({epochs} epochs)...")
+    for _ in range(epochs):
+        for X, y in rebatch(labelled_blocks(store, block_ids=consumed), n_components):
+            clf.partial_fit(ipca.transform(scaler.transform(X)), y, classes=CLASSES)
+
+    pipeline = Pipeline([('scaler', scaler), ('pca', ipca), ('clf', clf)])
+
+    metadata = {
+        'incremental': True,
+        'feature_store': os.path.abspath(store_dir),
+        'data_hash': blocks_fingerprint(consumed),
+        'n_samples': n_samples,
+        'feature_names': store.feature_names,
+        'n_components': n_components,
+        'epochs': epochs,
+        'consumed_blocks': consumed,
+        'random_state': random_state,
+        'use_vad': bool(use_vad),
+    }
+    version_dir = export_artifacts(pipeline, model_root, metadata)
+    print(f"\nTrained on {n_samples} samples, model exported to: {version_dir}")
+    return version_dir
+
+
+def update_incremental(store_dir, model_root='models', update_transforms=False):
+    """
+    Update the latest incremental model with blocks it has not seen yet
+
+    By default only the classifier is updated, with a single pass over the
+    new blocks: nothing already consumed is read again and the scaler and
+    PCA basis the classifier was trained against stay fixed. With
+    update_transforms the PCA basis is first updated with the new blocks
+    (the scaler is never updated here: that needs fit_incremental from
+    scratch); since that moves the space the classifier works in, the
+    classifier then gets one more pass over every consumed block, old and
+    new. Either way the result is exported as a new version.
+
+    Args:
+        store_dir (str): FeatureStore directory
+        model_root (str): Directory holding the model versions
+        update_transforms (bool): Also update the PCA basis
+
+    Returns:
+        str: Path to the exported version directory, or None if there was nothing new
+    """
+    with open(os.path.join(model_root, 'LATEST')) as f:
+        version = f.read().strip()
+    with open(os.path.join(model_root, version, 'metadata.json')) as f:
+        metadata = json.load(f)
+    if not metadata.get('incremental'):
+        raise ValueError(f"Model {version} was not trained incrementally; run fit first")
+
+    pipeline = joblib.load(os.path.join(model_root, version, 'model.joblib'))
+    store = FeatureStore(store_dir)
+    n_components = pipeline.named_steps['pca'].n_components_
+
+    consumed = list(metadata['consumed_blocks'])
+    new_blocks, n_new = [], 0
+    for block_id, X, _ in labelled_blocks(store, exclude=consumed):
+        new_blocks.append(block_id)
+        n_new += len(X)
+
+    if n_new == 0:
+        print("No new labelled blocks, model unchanged")
+        return None
+
+    if update_transforms:
+        print("Updating PCA basis (scaler frozen)...")
+        for X, _ in rebatch(labelled_blocks(store, block_ids=new_blocks), n_components):
+            partial_fit_transforms(pipeline, X)
+        print("Updating classifier on every consumed block...")
+        classifier_blocks = consumed + new_blocks
+    else:
+        classifier_blocks = new_blocks
+    for X, y in rebatch(labelled_blocks(store, block_ids=classifier_blocks), n_components):
+        partial_fit_classifier(pipeline, X, y)
+    consumed += new_blocks
+
+    metadata = dict(metadata,
+                    parent_version=version,
+                    data_hash=blocks_fingerprint(consumed),
+                    n_samples=metadata['n_samples'] + n_new,
+                    consumed_blocks=consumed,
+                    transforms_updated=update_transforms)
+    version_dir = export_artifacts(pipeline, model_root, metadata)
+    print(f"\nUpdated with {n_new} new samples, model exported to: {version_dir}")
+    return version_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Out-of-core incremental training")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help="Import a feature CSV into the store")
+    import_parser.add_argument('csv')
+    import_parser.add_argument('--store', default='feature_store')
+    import_parser.add_argument('--chunksize', type=int, default=10_000)
+
+    fit_parser = subparsers.add_parser('fit', help="Train from scratch on the whole store")
+    fit_parser.add_argument('--store', default='feature_store')
+    fit_parser.add_argument('--out', default='models')
+    fit_parser.add_argument('--n-components', type=int, default=32)
+    fit_parser.add_argument('--epochs', type=int, default=5)
+    fit_parser.add_argument('--seed', type=int, default=42)
+    fit_parser.add_argument('--vad', action=argparse.BooleanOptionalAction, default=vad.USE_VAD,
+                            help="Whether the features were extracted with VAD "
+                                 "(default: ADHD_USE_VAD)")
+
+    update_parser = subparsers.add_parser('update', help="Update the latest model with new blocks")
+    update_parser.add_argument('--store', default='feature_store')
+    update_parser.add_argument('--out', default='models')
+    update_parser.add_argument('--update-transforms', action='store_true',
+                               help="Also update the PCA basis (the scaler stays frozen; refit "
+                                    "to change it), then pass the "
+                                    "classifier over every consumed block again")
+
+    args = parser.parse_args()
+    if args.command == 'import':
+        FeatureStore(args.store).import_csv(args.csv, chunksize=args.chunksize)
+    elif args.command == 'fit':
+        fit_incremental(args.store, model_root=args.out, n_components=args.n_components,
+                        epochs=args.epochs, random_state=args.seed, use_vad=args.vad)
+    else:
+        update_incremental(args.store, model_root=args.out,
+                           update_transforms=args.update_transforms)
+
+
+if __name__ == "__main__":
+    main()
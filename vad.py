@@ -0,0 +1,139 @@
+import os
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Frames analysed per block; keeps the strided view's temporaries small
+FRAME_BLOCK = 4096
+
+# Whether extraction drops silence first. Serving and every training
+# extraction path default to this one setting: a model trained on features
+# of whole recordings scores speech-only features from a different
+# distribution (and vice versa), so both sides must use the same value.
+# Exported models record it in metadata.json and the model registry rejects
+# versions trained with the other setting. Off by default because the
+# legacy model was trained on whole recordings; ADHD_USE_VAD=1 turns VAD on
+# everywhere, for models trained that way.
+USE_VAD = os.environ.get('ADHD_USE_VAD', '0') == '1'
+
+
+def frame_stats(y, frame_length, hop_length):
+    """
+    Log energy and zero-crossing rate for every frame of a signal
+
+    Frames are strided views of the signal and are reduced a block at a
+    time, so a long recording never needs a full (n_frames, frame_length)
+    copy.
+
+    Args:
+        y (numpy.ndarray): Mono signal
+        frame_length (int): Samples per frame
+        hop_length (int): Samples between frame starts
+
+    Returns:
+        tuple: (energy in dB, zero-crossing rate) arrays, one value per frame
+    """
+    if len(y) < frame_length:
+        y = np.pad(y, (0, frame_length - len(y)))
+    frames = sliding_window_view(y, frame_length)[::hop_length]
+
+    energy_db = np.empty(len(frames), dtype=np.float32)
+    zcr = np.empty(len(frames), dtype=np.float32)
+    for start in range(0, len(frames), FRAME_BLOCK):
+        block = frames[start:start + FRAME_BLOCK]
+        energy = np.einsum('ij,ij->i', block, block) / frame_length
+        energy_db[start:start + len(block)] = 10 * np.log10(energy + 1e-10)
+        signs = np.signbit(block)
+        zcr[start:start + len(block)] = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frame_length
+    return energy_db, zcr
+
+
+def _remove_short_runs(mask, min_length, value):
+    """Flip runs of `value` shorter than min_length frames in a boolean mask"""
+    padded = np.concatenate([[not value], mask, [not value]])
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    starts, ends = edges[::2], edges[1::2]
+    short = (ends - starts) < min_length
+    for start, end in zip(starts[short], ends[short]):
+        mask[start:end] = not value
+    return mask
+
+
+def detect_speech(y, sr, frame_ms=30, hop_ms=10, margin_db=12.0, floor_db=-55.0,
+                  max_zcr=0.25, min_speech_ms=150, min_silence_ms=300):
+    """
+    Frame-level voice activity detection from energy and zero-crossing rate
+
+    A frame counts as speech when its energy is margin_db above the
+    recording's noise floor (10th percentile of frame energy) and above an
+    absolute floor. Frames with a noise-like zero-crossing rate need an
+    extra 6 dB. Short pauses inside speech are bridged first, so syllables
+    join into words, and speech runs that are still short are then dropped.
+
+    Args:
+        y (numpy.ndarray): Mono signal
+        sr (int): Sampling rate
+        frame_ms (float): Frame length in milliseconds
+        hop_ms (float): Hop between frames in milliseconds
+        margin_db (float): Required energy above the noise floor
+        floor_db (float): Absolute energy floor in dBFS
+        max_zcr (float): Zero-crossing rate above which a frame looks like noise
+        min_speech_ms (float): Shorter speech runs are discarded
+        min_silence_ms (float): Shorter pauses are kept as speech
+
+    Returns:
+        tuple: (boolean speech mask per frame, hop length in samples)
+    """
+    frame_length = int(sr * frame_ms / 1000)
+    hop_length = int(sr * hop_ms / 1000)
+    energy_db, zcr = frame_stats(y, frame_length, hop_length)
+
+    threshold = max(np.percentile(energy_db, 10) + margin_db, floor_db)
+    speech = (energy_db > threshold) & ((zcr < max_zcr) | (energy_db > threshold + 6))
+
+    # Bridge pauses first so syllables merge into words before short bursts are dropped
+    speech = _remove_short_runs(speech, max(1, int(min_silence_ms / hop_ms)), False)
+    speech = _remove_short_runs(speech, max(1, int(min_speech_ms / hop_ms)), True)
+    return speech, hop_length
+
+
+def keep_speech(y, sr, **kwargs):
+    """
+    Drop non-speech regions and join the speech back together
+
+    Args:
+        y (numpy.ndarray): Mono signal
+        sr (int): Sampling rate
+        **kwargs: Options passed to detect_speech
+
+    Returns:
+        tuple: (speech-only signal, report dict with total/kept/discarded seconds).
+            The signal is a view of y when speech forms a single region and
+            one new contiguous buffer otherwise.
+    """
+    speech, hop_length = detect_speech(y, sr, **kwargs)
+
+    # Speech runs as sample ranges
+    padded = np.concatenate([[False], speech, [False]])
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    starts = edges[::2] * hop_length
+    ends = np.minimum(edges[1::2] * hop_length + hop_length, len(y))
+
+    if len(starts) == 1:
+        # One contiguous speech region: return a view instead of copying
+        y_speech = y[starts[0]:ends[0]]
+    elif len(starts):
+        y_speech = np.concatenate([y[s:e] for s, e in zip(starts, ends)])
+    else:
+        y_speech = y[:0]
+
+    total = len(y) / sr
+    kept = len(y_speech) / sr
+    report = {
+        'total_seconds': round(total, 2),
+        'speech_seconds': round(kept, 2),
+        'discarded_seconds': round(total - kept, 2),
+        'discarded_ratio': round((total - kept) / total, 4) if total else 0.0,
+        'speech_regions': int(len(starts)),
+    }
+    return y_speech, report
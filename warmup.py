@@ -0,0 +1,133 @@
+"""
+Warm-up at worker boot so the first real upload is not the slow one
+
+The first request in a fresh worker otherwise pays for loading the model
+artifacts, openSMILE's native library and config, the resampler and
+numpy/sklearn code paths. warm_up() runs the full serving pipeline once
+on a short synthetic clip, and the readiness object records when that is
+done so /readyz can keep the load balancer away until then.
+"""
+import os
+import time
+import tempfile
+import threading
+
+import numpy as np
+import soundfile as sf
+
+# Long enough for a full eGeMAPS functional segment, short enough to be quick
+WARMUP_SECONDS = 3.0
+# Native rate of the synthetic clip; differs from 16 kHz so resampling is exercised
+WARMUP_SR = 44100
+
+
+class Readiness:
+    """Thread-safe record of the warm-up state reported by /readyz"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.state = 'cold'
+        self.error = None
+        self.seconds = None
+
+    def set(self, state, error=None, seconds=None):
+        with self._lock:
+            self.state, self.error, self.seconds = state, error, seconds
+
+    @property
+    def ready(self):
+        return self.state == 'ready'
+
+    def status(self):
+        with self._lock:
+            status = {'status': self.state}
+            if self.seconds is not None:
+                status['warmup_seconds'] = round(self.seconds, 3)
+            if self.error:
+                status['error'] = self.error
+            return status
+
+
+readiness = Readiness()
+# Whether this process already ran the pipeline once
+_warm = False
+
+
+def synthetic_clip(path, seconds=WARMUP_SECONDS, sr=WARMUP_SR):
+    """
+    Write a speech-like test clip: a pitch-modulated harmonic tone in
+    syllable-sized bursts, so voice activity detection keeps it
+
+    Args:
+        path (str): Destination .wav path
+        seconds (float): Clip length
+        sr (int): Sampling rate
+    """
+    t = np.arange(int(seconds * sr)) / sr
+    f0 = 160 + 20 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+    y = 0.2 * voice * envelope + 1e-3 * np.random.default_rng(0).standard_normal(len(t))
+    sf.write(path, y.astype(np.float32), sr)
+
+
+def warm_up():
+    """
+    Run decode, resample, VAD, openSMILE extraction and model scoring once
+
+    Returns:
+        float: Seconds the warm-up took
+
+    Raises:
+        RuntimeError: If the pipeline did not produce a prediction
+    """
+    global _warm
+    import predict
+
+    start = time.perf_counter()
+    fd, path = tempfile.mkstemp(suffix='.wav', prefix='warmup_')
+    os.close(fd)
+    try:
+        synthetic_clip(path)
+        result = predict.analyse_file(path)
+    finally:
+        os.remove(path)
+    if not result.get('success'):
+        raise RuntimeError(result.get('message', 'warm-up prediction failed'))
+    _warm = True
+    return time.perf_counter() - start
+
+
+def warm_process():
+    """
+    Process-pool task: warm the worker process it lands in, once
+
+    Returns:
+        int: The worker's pid, so the caller can tell which workers are warm
+    """
+    if not _warm:
+        warm_up()
+    return os.getpid()
+
+
+def run():
+    """
+    Warm up this process now and update readiness
+
+    Returns:
+        float: Seconds the warm-up took
+
+    Raises:
+        Exception: Whatever made the warm-up fail, after readiness records it
+    """
+    readiness.set('warming')
+    try:
+        seconds = warm_up()
+    except Exception as e:
+        readiness.set('failed', error=str(e))
+        print(f"Warm-up failed: {str(e)}")
+        raise
+    readiness.set('ready', seconds=seconds)
+    print(f"Warm-up finished in {seconds:.2f}s")
+    return seconds